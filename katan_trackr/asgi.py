@@ -0,0 +1,36 @@
+"""
+ASGI config for katan_trackr project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+# Determine if we are running on Heroku
+if 'DYNO' in os.environ:
+    SETTINGS = "katan_trackr.settings.prod"
+else:
+    SETTINGS = "katan_trackr.settings.dev"
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", SETTINGS)
+
+django_asgi = get_asgi_application()
+
+# Django 3.1 iterates a streaming response on the event loop, where the exports' lazy
+# queries are not allowed, so those routes are served by the WSGI handler in a thread
+django_wsgi = WsgiToAsgi(get_wsgi_application())
+WSGI_PATHS = {reverse('export-scoresheets'), reverse('export-games')}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] in WSGI_PATHS:
+        return await django_wsgi(scope, receive, send)
+    return await django_asgi(scope, receive, send)
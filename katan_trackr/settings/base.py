@@ -53,6 +53,7 @@ INSTALLED_APPS += CUSTOM_APPS
 AUTH_USER_MODEL = 'scores.Player'
 
 MIDDLEWARE = [
+    'scores.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,6 +100,50 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Rendered statistics pages are cached until the next write (see scores/cache.py). The
+# backend is chosen with PAGE_CACHE_BACKEND; 'db' needs `python manage.py createcachetable`.
+
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'locmem')
+PAGE_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'katan-trackr-pages',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('PAGE_CACHE_LOCATION', os.path.join(BASE_DIR, '.page_cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('PAGE_CACHE_LOCATION', 'scores_page_cache'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    PAGE_CACHE_ALIAS: dict(PAGE_CACHE_BACKENDS[PAGE_CACHE_BACKEND], TIMEOUT=None, OPTIONS={'MAX_ENTRIES': 1000}),
+}
+
+
+# Concurrent queries
+# The async statistics, comparisons and profile views send their independent queries
+# through a pool of this many threads per process (see scores/concurrency.py); each thread
+# holds its own database connection. 1 runs them one after another.
+
+STATS_QUERY_WORKERS = int(os.environ.get('STATS_QUERY_WORKERS', 4))
+
+
+# Request profiling
+# The share of requests (0 to 1) that scores.profiling.ProfilingMiddleware times and reports
+# in a Server-Timing header and on the infologger. 0 turns the middleware off.
+
+REQUEST_PROFILING_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -135,6 +180,11 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
+# django_heroku below switches to WhiteNoise's CompressedManifestStaticFilesStorage:
+# collectstatic writes hashed names with gzip and (with Brotli installed) .br variants,
+# and WhiteNoise serves the hashed names with immutable, far-future Cache-Control.
+# Front-end libraries are vendored under scores/static/scores/vendor (see scores/assets.py).
+
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
@@ -178,4 +228,5 @@ LOGGING = {
 }
 
 # Configure Django App for Heroku.
-django_heroku.settings(locals())
+# Its logging configuration would replace LOGGING above and drop the infologger.
+django_heroku.settings(locals(), logging=False)
@@ -0,0 +1,21 @@
+"""Settings for running the app, its tests and its benchmarks on SQLite.
+
+No PostgreSQL server is needed. The database lives in memory unless SQLITE_PATH names a
+file; an in-memory database only lasts as long as its connection, so use a file for
+``runserver`` and the default for ``test`` and ``benchmark``, which build their own.
+"""
+import os
+from .dev import *
+
+SECRET_KEY = SECRET_KEY or 'sqlite-local-only'
+
+SQLITE_PATH = os.environ.get('SQLITE_PATH', ':memory:')
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+        # A file-backed test database lets the concurrent writer tests run as well
+        'TEST': {'NAME': None if SQLITE_PATH == ':memory:' else SQLITE_PATH + '.test'},
+    }
+}
@@ -0,0 +1 @@
+default_app_config = 'scores.apps.ScoresConfig'
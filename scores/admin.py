@@ -1,14 +1,19 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers, widgets
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
+from django.core.exceptions import PermissionDenied
 from django.forms.models import BaseInlineFormSet
-from django.shortcuts import get_object_or_404
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils.safestring import mark_safe
 
 # Register your models here.
 from .models import Player, Location, Edition, Game, Scoresheet
+from .recording import RecordingError, record_game
 
 class BaseAdmin(admin.ModelAdmin):
     pass
@@ -70,8 +75,9 @@ class PlayerAdmin(BaseUserAdmin):
     # The fields to be used in displaying the User model.
     # These override the definitions on the base UserAdmin
     # that reference specific fields on auth.User.
-    list_display = ('first_name', 'last_name', 'email', 'is_active')
+    list_display = ('first_name', 'last_name', 'email', 'games_played', 'is_active')
     list_display_links = ('first_name', 'last_name', 'email')
+    list_select_related = ('stats', )
     list_filter = ('is_active', )
     fieldsets = (
         (None, {'fields': (('first_name', 'last_name'), ('email', 'password'), )}),
@@ -93,6 +99,11 @@ class PlayerAdmin(BaseUserAdmin):
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
 
+    def games_played(self, obj):
+        return obj.num_games_played()
+    games_played.short_description = '# of games played'
+    games_played.admin_order_field = 'stats__games_played'
+
 # Now register the new UserAdmin...
 admin.site.register(Player, PlayerAdmin)
 # ... and, since we're not using Django's built-in permissions,
@@ -103,9 +114,18 @@ admin.site.unregister(Group)
 @admin.register(Location)
 class LocationAdmin(BaseAdmin):
     fields = ('name', ('latitude', 'longitude'))
-    list_display = ('name', )
+    list_display = ('name', 'times_played')
     exclude = ('is_active', )
 
+    def get_queryset(self, request):
+        # Annotated onto the changelist queryset instead of counting games once per row
+        return super().get_queryset(request).with_stats()
+
+    def times_played(self, obj):
+        return obj.times_played
+    times_played.short_description = '# of games played'
+    times_played.admin_order_field = 'times_played'
+
 
 @admin.register(Edition)
 class EditionAdmin(BaseAdmin):
@@ -114,9 +134,14 @@ class EditionAdmin(BaseAdmin):
     list_display = ('name', 'game_type', 'image_tag', 'max_players', 'duration', 'points', 'times_played')
     exclude = ('is_active', )
 
+    def get_queryset(self, request):
+        # Annotated onto the changelist queryset instead of counting games once per row
+        return super().get_queryset(request).with_stats()
+
     def times_played(self, obj):
-        return obj.games_played()
+        return obj.times_played
     times_played.short_description = '# of games played'
+    times_played.admin_order_field = 'times_played'
 
 
 class ScoresheetInlineFormSet(BaseInlineFormSet):
@@ -135,6 +160,10 @@ class ScoresheetInline(admin.TabularInline):
     exclude = ('is_active', )
     formset = ScoresheetInlineFormSet
 
+    def get_queryset(self, request):
+        # Each inline row is labelled with the scoresheet, whose name comes from its player
+        return super().get_queryset(request).select_related('player')
+
 
 @admin.register(Scoresheet)
 class ScoresheetAdmin(BaseAdmin):
@@ -161,12 +190,13 @@ class ScoresheetAdmin(BaseAdmin):
         }),
     )
     list_display = ('game', 'edition_playd', 'player', 'color', 'total_points')
+    list_select_related = ('game__edition', 'player')
     exclude = ('is_active', )
 
     def edition_playd(self, obj):
-        game = get_object_or_404(Game, pk=obj.game.pk)
-        return game.edition.name
+        return obj.game.edition.name
     edition_playd.short_description = 'game edition'
+    edition_playd.admin_order_field = 'game__edition__name'
 
 
 class CustomGameModelForm(forms.ModelForm):
@@ -176,7 +206,36 @@ class CustomGameModelForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super(CustomGameModelForm, self).__init__(*args, **kwargs)
-        self.fields['winning_scoresheet'].queryset = Scoresheet.objects.filter(game_id=self.instance.id)
+        self.fields['winning_scoresheet'].queryset = Scoresheet.objects.filter(game_id=self.instance.id) \
+                                                                       .select_related('player')
+
+
+class RecordGameForm(forms.ModelForm):
+    class Meta:
+        model = Game
+        fields = ('date_start', 'date_finish', 'edition', 'location')
+        field_classes = {'date_start': forms.SplitDateTimeField, 'date_finish': forms.SplitDateTimeField}
+        widgets = {'date_start': widgets.AdminSplitDateTime, 'date_finish': widgets.AdminSplitDateTime}
+
+
+class RecordScoresheetForm(forms.ModelForm):
+    is_winner = forms.BooleanField(label='winner', required=False,
+                                   help_text='Only needed to break a tie for the top score.')
+
+    class Meta:
+        model = Scoresheet
+        exclude = ('game', 'is_active')
+
+
+class BaseRecordScoresheetFormSet(forms.BaseFormSet):
+    def get_form_kwargs(self, index):
+        # Seats are numbered in form order unless changed; the empty form has no index
+        return {} if index is None else {'initial': {'start_position': index + 1}}
+
+
+RecordScoresheetFormSet = forms.formset_factory(RecordScoresheetForm, formset=BaseRecordScoresheetFormSet,
+                                                extra=4, min_num=2, max_num=6, validate_min=True,
+                                                validate_max=True)
 
 
 @admin.register(Game)
@@ -184,9 +243,54 @@ class GameAdmin(BaseAdmin):
     form = CustomGameModelForm
     fields = (('date_start', 'date_finish'), ('edition', 'location'), 'winning_scoresheet')
     list_display = ('get_formatted_number', 'game_nickname', 'date_start', 'duration', 'edition', 'location', 'winning_scoresheet')
+    list_select_related = ('edition', 'location', 'winning_scoresheet__player')
     exclude = ('is_active', )
     inlines = (ScoresheetInline, )
 
+    change_list_template = 'admin/scores/game/change_list.html'
+
     def game_nickname(self, obj):
         return obj.get_display_name()
     game_nickname.short_description = 'game nickname'
+
+    def get_urls(self):
+        return [
+            path('record/', self.admin_site.admin_view(self.record_game_view), name='scores_game_record'),
+        ] + super().get_urls()
+
+    def record_game_view(self, request):
+        """Enter a game with all of its scoresheets; the winner is worked out from the scores."""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        form = RecordGameForm(request.POST or None)
+        formset = RecordScoresheetFormSet(request.POST or None, prefix='scoresheets')
+        if request.method == 'POST' and form.is_valid() and formset.is_valid():
+            scoresheets = []
+            for scoresheet_form in formset:
+                if scoresheet_form.has_changed():
+                    scoresheet = scoresheet_form.save(commit=False)
+                    scoresheet.is_winner = scoresheet_form.cleaned_data['is_winner']
+                    scoresheets.append(scoresheet)
+            try:
+                game = record_game(form.save(commit=False), scoresheets)
+            except RecordingError as exc:
+                form.add_error(None, str(exc))
+            else:
+                self.log_addition(request, game, [{'added': {}}])
+                self.message_user(request, 'Recorded game {}.'.format(game.get_formatted_number()),
+                                  messages.SUCCESS)
+                return HttpResponseRedirect(reverse('admin:scores_game_changelist'))
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Record a game',
+            opts=self.model._meta,
+            form=form,
+            adminform=helpers.AdminForm(form, [(None, {'fields': (('date_start', 'date_finish'),
+                                                                  ('edition', 'location'))})], {}),
+            formset=formset,
+            media=self.media + form.media + formset.media,
+            errors=helpers.AdminErrorList(form, [formset]),
+        )
+        return TemplateResponse(request, 'admin/scores/game/record_game.html', context)
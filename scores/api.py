@@ -0,0 +1,102 @@
+"""Read-only JSON API for the page charts, versioned under /api/v1/.
+
+Every response carries an ETag and a Last-Modified header built from the newest ``modified``
+timestamp of the tables it reads. That timestamp is looked up once per ledger version and
+kept in the page cache, so a revalidation that matches is answered with 304 before any
+aggregation runs. Deletions do not move ``modified``, but they do bump the ledger version,
+which is part of the ETag.
+"""
+import hashlib
+
+from django.db.models import Max, Sum
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+from .cache import page_cache, request_ledger_version
+from .models import Player, Edition, Game, Scoresheet, DailyPlayerRollup
+from .stats import compute_edition_averages
+
+
+def latest_modified(version, *models):
+    """Newest ``modified`` timestamp across ``models``, or None when they are all empty."""
+    key = 'scores:api:modified:{}:{}'.format(version,
+                                             ','.join(model._meta.label_lower for model in models))
+    cache = page_cache()
+    cached = cache.get(key)
+    if cached is None:
+        stamps = [model.objects.aggregate(latest=Max('modified'))['latest'] for model in models]
+        cached = (max((stamp for stamp in stamps if stamp is not None), default=None), )
+        cache.set(key, cached, timeout=None)
+    return cached[0]
+
+
+def rounded(value):
+    return None if value is None else round(value, 1)
+
+
+def conditional(*models):
+    """Answer GET/HEAD with ETag/Last-Modified revalidation over ``models``."""
+    def last_modified(request, *args, **kwargs):
+        return latest_modified(request_ledger_version(request), *models)
+
+    def etag(request, *args, **kwargs):
+        # The local date keeps "this year" data honest across midnight
+        version = request_ledger_version(request)
+        stamp = latest_modified(version, *models)
+        parts = [version, stamp.isoformat() if stamp else '', timezone.localdate().isoformat(),
+                 request.get_full_path()]
+        return hashlib.md5(':'.join(map(str, parts)).encode('utf-8')).hexdigest()
+
+    def decorator(view):
+        view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+        return require_safe(cache_control(no_cache=True)(view))
+    return decorator
+
+
+def year_rollups():
+    """This local year's daily player rollups, summed per player."""
+    year_start = timezone.localdate().replace(month=1, day=1)
+    return DailyPlayerRollup.objects.filter(day__gte=year_start) \
+                                    .values('player', 'player__first_name') \
+                                    .order_by('player')
+
+
+@conditional(Player, Game, Scoresheet)
+def year_points(request):
+    """Total points per player in the current year."""
+    points = year_rollups().annotate(total_points=Sum('points'))
+    return JsonResponse({'players': [{'id': str(row['player']), 'name': row['player__first_name'],
+                                      'points': row['total_points']} for row in points]})
+
+
+@conditional(Player, Game, Scoresheet)
+def year_wins(request):
+    """Wins per player in the current year."""
+    wins = year_rollups().filter(wins__gt=0).annotate(total_wins=Sum('wins'))
+    return JsonResponse({'players': [{'id': str(row['player']), 'name': row['player__first_name'],
+                                      'wins': row['total_wins']} for row in wins]})
+
+
+@conditional(Player, Game, Scoresheet)
+def player_recent_games(request, player):
+    """The player's last ten scores, newest first."""
+    player = get_object_or_404(Player, pk=player)
+    recent = Scoresheet.objects.filter(is_active=True, game__is_active=True, player=player) \
+                               .order_by('-game__date_start', '-game__number') \
+                               .values_list('game__number', 'game__date_start', 'total_points')[:10]
+    return JsonResponse({'games': [{'game': number, 'date_start': date_start, 'points': points}
+                                   for number, date_start, points in recent]})
+
+
+@conditional(Player, Edition, Game, Scoresheet)
+def player_edition_averages(request, player):
+    """Average points and standard deviation by edition, for the player and everyone else."""
+    player = get_object_or_404(Player, pk=player)
+    return JsonResponse({'editions': [
+        {'edition': e.edition, 'scoresheets': e.scoresheets,
+         'average': rounded(e.average), 'deviation': rounded(e.deviation),
+         'others_average': rounded(e.others_average), 'others_deviation': rounded(e.others_deviation)}
+        for e in compute_edition_averages(player.pk)]})
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ScoresConfig(AppConfig):
     name = 'scores'
+
+    def ready(self):
+        from . import signals  # noqa: F401
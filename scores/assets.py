@@ -0,0 +1,73 @@
+"""Front-end libraries served from scores/static instead of a third-party CDN.
+
+Every library is pinned to a release, and to the Subresource Integrity hash the pages
+loaded it with where there is one. `python manage.py vendor_assets` downloads them into
+scores/static/scores/vendor, from where collectstatic gives them hashed names plus gzip
+and Brotli variants, and WhiteNoise serves them with far-future immutable cache headers.
+Until an asset (and every file it references) is vendored, the {% vendored %} tag loads
+it from the pinned CDN URL instead, so a partial checkout still renders.
+"""
+import base64
+import hashlib
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from django.contrib.staticfiles import finders
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+VENDOR_DIR = 'scores/vendor/'
+CDNJS = 'https://cdnjs.cloudflare.com/ajax/libs/'
+
+
+@dataclass(frozen=True)
+class Asset:
+    path: str
+    url: str
+    integrity: Optional[str] = None
+    # Files the asset loads relative to itself, e.g. a stylesheet's fonts
+    extras: Tuple[str, ...] = ()
+
+    @property
+    def static_path(self):
+        return VENDOR_DIR + self.path
+
+    def files(self):
+        """(static path, URL) pairs for the asset and its extras."""
+        base_path, base_url = self.static_path.rsplit('/', 1)[0], self.url.rsplit('/', 1)[0]
+        yield self.static_path, self.url
+        for extra in self.extras:
+            yield '{}/{}'.format(base_path, extra), '{}/{}'.format(base_url, extra)
+
+
+SEMANTIC_UI_THEME = tuple(['themes/default/assets/fonts/{}.{}'.format(font, extension)
+                           for font in ('icons', 'outline-icons', 'brand-icons')
+                           for extension in ('eot', 'svg', 'ttf', 'woff', 'woff2')] +
+                          ['themes/default/assets/images/flags.png'])
+
+ASSETS = {
+    'jquery': Asset('jquery/3.4.1/jquery.min.js', CDNJS + 'jquery/3.4.1/jquery.min.js',
+                    'sha256-CSXorXvZcTkaix6Yvo6HppcZGetbYMGWSFlBw8HfCJo='),
+    'semantic-ui-js': Asset('semantic-ui/2.4.1/semantic.min.js', CDNJS + 'semantic-ui/2.4.1/semantic.min.js',
+                            'sha256-t8GepnyPmw9t+foMh3mKNvcorqNHamSKtKRxxpUEgFI='),
+    'semantic-ui-css': Asset('semantic-ui/2.4.1/semantic.min.css', CDNJS + 'semantic-ui/2.4.1/semantic.min.css',
+                             'sha512-8bHTC73gkZ7rZ7vpqUQThUDhqcNFyYi2xgDgPDHc+GXVGHXq+xPjynxIopALmOPqzo9JZj0k6OqqewdGO3EsrQ==',
+                             SEMANTIC_UI_THEME),
+    'highcharts': Asset('highcharts/8.0.0/highcharts.js', 'https://code.highcharts.com/8.0.0/highcharts.js'),
+    'mapbox-gl-js': Asset('mapbox-gl/1.6.1/mapbox-gl.js',
+                          'https://api.tiles.mapbox.com/mapbox-gl-js/v1.6.1/mapbox-gl.js'),
+    'mapbox-gl-css': Asset('mapbox-gl/1.6.1/mapbox-gl.css',
+                           'https://api.tiles.mapbox.com/mapbox-gl-js/v1.6.1/mapbox-gl.css'),
+}
+
+
+@lru_cache(maxsize=None)
+def is_vendored(name):
+    return all(finders.find(path) for path, _ in ASSETS[name].files())
+
+
+def integrity_matches(content, integrity):
+    """Whether ``content`` matches a ``sha256-``/``sha384-``/``sha512-`` integrity value."""
+    algorithm, _, expected = integrity.partition('-')
+    return base64.b64encode(hashlib.new(algorithm, content).digest()).decode('ascii') == expected
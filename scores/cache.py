@@ -0,0 +1,117 @@
+"""Page cache keyed on the ledger version.
+
+The ledger version is a single counter in the page cache that changes once a write to a game,
+scoresheet, edition, location or player commits. Cached pages are stored under the version
+they were rendered for, so a write invalidates every page at once and nothing ever expires
+on a timer. A request reads the version at most once.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+LEDGER_VERSION_KEY = 'scores:ledger-version'
+
+_pending = threading.local()
+
+
+def page_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def get_ledger_version():
+    cache = page_cache()
+    version = cache.get(LEDGER_VERSION_KEY)
+    if version is None:
+        # Never restart from a small number, or pages cached before an eviction could be served again
+        cache.add(LEDGER_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(LEDGER_VERSION_KEY)
+    return version
+
+
+def request_ledger_version(request):
+    # Read once per request: the page cache key, ETag and Last-Modified all need it
+    if not hasattr(request, 'ledger_version'):
+        request.ledger_version = get_ledger_version()
+    return request.ledger_version
+
+
+def bump_ledger_version():
+    cache = page_cache()
+    try:
+        cache.incr(LEDGER_VERSION_KEY)
+    except ValueError:
+        cache.add(LEDGER_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_pending_version():
+    if getattr(_pending, 'bump', False):
+        _pending.bump = False
+        bump_ledger_version()
+
+
+def invalidate_pages():
+    """Bump the ledger version once the surrounding transaction commits.
+
+    Only one bump runs however many writes the transaction made, and it takes no database
+    lock. A page rendered from the data as it was before the commit is stored under the old
+    version, so it is never served afterwards.
+    """
+    _pending.bump = True
+    transaction.on_commit(bump_pending_version)
+
+
+def page_cache_key(request):
+    # The local date keeps "this month"/"this year" pages honest across midnight
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return 'scores:page:{}:{}:{}:{}'.format(request_ledger_version(request), timezone.localdate().isoformat(),
+                                            int(request.user.is_authenticated), path)
+
+
+def cached_response(request):
+    """The cache key for ``request`` and the response cached under it, or None."""
+    key = page_cache_key(request)
+    return key, page_cache().get(key)
+
+
+def cache_response(key, response):
+    if response.status_code == 200 and not response.streaming and not response.cookies:
+        page_cache().set(key, response, timeout=None)
+
+
+def cache_per_ledger_version(view):
+    """Serve GET/HEAD responses for ``view`` from the page cache until the ledger changes.
+
+    Coroutine views stay coroutines; the cache is then read and written from a thread.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped_async(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+
+            key, response = await sync_to_async(cached_response, thread_sensitive=True)(request)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                await sync_to_async(cache_response, thread_sensitive=True)(key, response)
+            return response
+        return wrapped_async
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+
+        key, response = cached_response(request)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            cache_response(key, response)
+        return response
+    return wrapped
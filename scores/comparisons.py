@@ -0,0 +1,203 @@
+"""Period-over-period comparisons for the comparisons page.
+
+Both periods are read from the daily rollups between the start of the previous period and
+the end of the current one: one query for games and time played per day, one for wins per
+player and day. Buckets (day, week or month), totals, the previous period "to date" and the
+percentage changes are all summed from those rows in Python. Rollups are per calendar day,
+so "to date" runs to the end of the matching day of the previous period.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DailyRollup, DailyPlayerRollup
+
+PERIODS = ('week', 'month', 'quarter', 'year', 'custom')
+BUCKETS = {'week': 'day', 'month': 'week', 'quarter': 'week', 'year': 'month'}
+
+
+def percent_change(current, previous):
+    """Change from ``previous`` to ``current`` in percent, or None when there is nothing to compare with."""
+    if not previous:
+        return None
+    return (current - previous) / previous * 100
+
+
+def add_months(day, months):
+    """The first of the month ``months`` after (or before) ``day``'s month."""
+    month = day.year * 12 + day.month - 1 + months
+    return day.replace(year=month // 12, month=month % 12 + 1, day=1)
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+@dataclass
+class Periods:
+    """The current period [start, end) and the previous one [previous_start, start).
+
+    ``to_date`` is the point in the previous period that is as far into it as now is into
+    the current one, for comparing a period that is still running.
+    """
+    kind: str
+    start: datetime
+    end: datetime
+    previous_start: datetime
+    to_date: datetime
+    bucket: str
+
+
+def get_periods(kind='year', start=None, end=None, now=None):
+    """Periods for ``kind``, one of PERIODS, around ``now``.
+
+    Custom periods run from the ``start`` date to the ``end`` date inclusive and are compared
+    with the same number of days just before them. Raises ValueError for an unknown period
+    or an empty custom range.
+    """
+    now = now or timezone.now()
+    if kind == 'custom':
+        if start is None or end is None or end < start:
+            raise ValueError('custom periods need a start date on or before the end date')
+        days = (end - start).days + 1
+        previous, current, following = start - timedelta(days=days), start, end + timedelta(days=1)
+        bucket = 'day' if days <= 31 else 'week' if days <= 183 else 'month'
+    elif kind in BUCKETS:
+        today = timezone.localdate(now)
+        if kind == 'week':
+            current = today - timedelta(days=today.weekday())
+            previous, following = current - timedelta(days=7), current + timedelta(days=7)
+        else:
+            months = {'month': 1, 'quarter': 3, 'year': 12}[kind]
+            current = add_months(today, -((today.month - 1) % months))
+            previous, following = add_months(current, -months), add_months(current, months)
+        bucket = BUCKETS[kind]
+    else:
+        raise ValueError('period must be one of {}'.format(', '.join(PERIODS)))
+
+    start, end, previous_start = local_midnight(current), local_midnight(following), local_midnight(previous)
+    elapsed = max(min(now, end) - start, timedelta())
+    return Periods(kind=kind, start=start, end=end, previous_start=previous_start,
+                   to_date=min(previous_start + elapsed, start), bucket=bucket)
+
+
+def parse_periods(params):
+    """Periods from the ``period``, ``start`` and ``end`` query parameters; raises ValueError."""
+    dates = {}
+    for name in ('start', 'end'):
+        raw = params.get(name)
+        try:
+            dates[name] = parse_date(raw) if raw else None
+        except ValueError:
+            dates[name] = None
+        if raw and dates[name] is None:
+            raise ValueError('{} must be a date in YYYY-MM-DD format'.format(name))
+    return get_periods(params.get('period') or 'year', **dates)
+
+
+@dataclass
+class Measure:
+    current: object = 0
+    previous: object = 0
+    previous_to_date: object = 0
+
+    @property
+    def change(self) -> Optional[float]:
+        return percent_change(self.current, self.previous_to_date)
+
+
+@dataclass
+class Comparison:
+    periods: Periods
+    games: Measure = field(default_factory=Measure)
+    duration: Measure = field(default_factory=lambda: Measure(timedelta(), timedelta(), timedelta()))
+    wins: List[Tuple[str, Measure]] = field(default_factory=list)
+    # Games per bucket: labels for the current period, then one count list per period
+    categories: List[str] = field(default_factory=list)
+    current_series: List[int] = field(default_factory=list)
+    previous_series: List[int] = field(default_factory=list)
+
+
+def bucket_start(day, bucket):
+    """The local date of the bucket that ``day`` falls in."""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_starts(start, end, bucket):
+    """Local dates of the buckets that cover [start, end)."""
+    day, last = bucket_start(timezone.localdate(start), bucket), timezone.localdate(end)
+    while day < last:
+        yield day
+        day = add_months(day, 1) if bucket == 'month' else day + timedelta(days=7 if bucket == 'week' else 1)
+
+
+def bucket_label(day, bucket):
+    return '{:%b}'.format(day) if bucket == 'month' else '{:%b} {}'.format(day, day.day)
+
+
+def end_of_day(moment):
+    """The local date after the day ``moment`` falls in, or that day itself at midnight."""
+    day = timezone.localdate(moment)
+    return day if moment == local_midnight(day) else day + timedelta(days=1)
+
+
+def comparison_queries(periods):
+    """The comparison's two rollup queries as independent callables, keyed by name."""
+    previous_start, end = timezone.localdate(periods.previous_start), timezone.localdate(periods.end)
+    days = DailyRollup.objects.filter(day__gte=previous_start, day__lt=end) \
+                              .values_list('day', 'games', 'total_duration')
+    wins = DailyPlayerRollup.objects.filter(day__gte=previous_start, day__lt=end, wins__gt=0) \
+                                    .values_list('day', 'player', 'player__first_name', 'wins')
+    return {'days': lambda: list(days), 'wins': lambda: list(wins)}
+
+
+def build_comparison(periods, results) -> Comparison:
+    """Fold the rows returned by the comparison_queries callables into a Comparison."""
+    start = timezone.localdate(periods.start)
+    to_date = min(end_of_day(periods.to_date), start)
+
+    comparison = Comparison(periods=periods)
+    series = ({}, {})
+    for day, games, duration in results['days']:
+        duration = duration or timedelta()
+        if day >= start:
+            comparison.games.current += games
+            comparison.duration.current += duration
+        else:
+            comparison.games.previous += games
+            comparison.duration.previous += duration
+            if day < to_date:
+                comparison.games.previous_to_date += games
+                comparison.duration.previous_to_date += duration
+        counts = series[day < start]
+        bucket = bucket_start(day, periods.bucket)
+        counts[bucket] = counts.get(bucket, 0) + games
+
+    wins = {}
+    for day, player_id, name, won in results['wins']:
+        measure = wins.setdefault(player_id, (name, Measure()))[1]
+        if day >= start:
+            measure.current += won
+        else:
+            measure.previous += won
+            if day < to_date:
+                measure.previous_to_date += won
+
+    comparison.wins = sorted(wins.values(), key=lambda win: (-win[1].current, -win[1].previous, win[0]))
+    current_days = list(bucket_starts(periods.start, periods.end, periods.bucket))
+    previous_days = list(bucket_starts(periods.previous_start, periods.start, periods.bucket))
+    comparison.categories = [bucket_label(day, periods.bucket) for day in current_days]
+    comparison.current_series = [series[0].get(day, 0) for day in current_days]
+    comparison.previous_series = [series[1].get(day, 0) for day in previous_days]
+    return comparison
+
+
+def compute_comparison(periods) -> Comparison:
+    return build_comparison(periods, {name: query() for name, query in comparison_queries(periods).items()})
@@ -0,0 +1,60 @@
+"""Run a page's independent queries concurrently from async views.
+
+Queries are plain callables keyed by name (see stats.statistics_queries). They run on a
+bounded pool of STATS_QUERY_WORKERS threads, each with its own database connection, so a
+page waits for its slowest query rather than for the sum of them. Where other connections
+cannot see the request's data - inside a transaction, or on an in-memory SQLite database -
+they run one after another on the request's own connection instead.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def query_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.STATS_QUERY_WORKERS,
+                                           thread_name_prefix='scores-query')
+        return _executor
+
+
+def runs_concurrently():
+    if settings.STATS_QUERY_WORKERS <= 1 or connection.in_atomic_block:
+        return False
+    return not (connection.vendor == 'sqlite' and connection.is_in_memory_db())
+
+
+def run_pooled(query):
+    try:
+        return query()
+    finally:
+        # Pool threads outlive requests, so apply CONN_MAX_AGE the way request_finished does
+        close_old_connections()
+
+
+def run_serially(queries):
+    return {name: query() for name, query in queries.items()}
+
+
+async def run_queries(queries):
+    """Run the ``queries`` callables and return their results under the same names."""
+    if not await sync_to_async(runs_concurrently, thread_sensitive=True)():
+        return await sync_to_async(run_serially, thread_sensitive=True)(queries)
+
+    loop = asyncio.get_running_loop()
+    executor = query_executor()
+    # Each query carries the request's context along, e.g. for scores.profiling
+    results = await asyncio.gather(*(loop.run_in_executor(executor, contextvars.copy_context().run,
+                                                           run_pooled, query)
+                                     for query in queries.values()))
+    return dict(zip(queries, results))
@@ -0,0 +1,131 @@
+"""Flat, streamed exports of games and scoresheets.
+
+Rows are read with ``values_list(...).iterator()`` so only one chunk is ever held in
+memory (PostgreSQL uses a server-side cursor), and each row is encoded as soon as it is
+fetched, so the response starts before the query has been read to the end.
+"""
+import csv
+import json
+import uuid
+from datetime import datetime, time, timedelta
+
+from django.db.models import BooleanField, Case, F, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Game, Scoresheet
+
+EXPORT_CHUNK_SIZE = 2000
+
+GAME_COLUMNS = (
+    ('game', 'number'),
+    ('game_id', 'id'),
+    ('date_start', 'date_start'),
+    ('date_finish', 'date_finish'),
+    ('duration_seconds', 'duration'),
+    ('edition', 'edition__name'),
+    ('edition_id', 'edition_id'),
+    ('location', 'location__name'),
+    ('location_id', 'location_id'),
+    ('winner_id', 'winning_scoresheet__player_id'),
+    ('winner_first_name', 'winning_scoresheet__player__first_name'),
+    ('winner_last_name', 'winning_scoresheet__player__last_name'),
+    ('winner_points', 'winning_scoresheet__total_points'),
+)
+
+SCORESHEET_COLUMNS = (
+    ('game', 'game__number'),
+    ('game_id', 'game_id'),
+    ('date_start', 'game__date_start'),
+    ('date_finish', 'game__date_finish'),
+    ('duration_seconds', 'game__duration'),
+    ('edition', 'game__edition__name'),
+    ('location', 'game__location__name'),
+    ('scoresheet_id', 'id'),
+    ('player_id', 'player_id'),
+    ('first_name', 'player__first_name'),
+    ('last_name', 'player__last_name'),
+    ('color', 'color'),
+    ('start_position', 'start_position'),
+    ('total_points', 'total_points'),
+    ('num_settlements', 'num_settlements'),
+    ('num_cities', 'num_cities'),
+    ('num_vpcards', 'num_vpcards'),
+    ('num_chits', 'num_chits'),
+    ('longest_road', 'longest_road'),
+    ('largest_army', 'largest_army'),
+    ('metro_science', 'metro_science'),
+    ('metro_politics', 'metro_politics'),
+    ('metro_trade', 'metro_trade'),
+    ('merchant', 'merchant'),
+    ('harbormaster', 'harbormaster'),
+    ('winner', 'is_winner'),
+)
+
+
+class Echo:
+    """File-like object whose write() hands the encoded line back to the caller."""
+    def write(self, value):
+        return value
+
+
+def flatten(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def parse_filters(params):
+    """Turn ``start``, ``end`` (inclusive local dates) and ``edition`` (a name) into game lookups.
+
+    Raises ValueError for dates that cannot be parsed.
+    """
+    lookups = {}
+    for name, lookup, days in (('start', 'date_start__gte', 0), ('end', 'date_start__lt', 1)):
+        raw = params.get(name)
+        if not raw:
+            continue
+        try:
+            day = parse_date(raw)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValueError('{} must be a date in YYYY-MM-DD format'.format(name))
+        # Compare against local midnight so the range stays index friendly
+        lookups[lookup] = timezone.make_aware(datetime.combine(day + timedelta(days=days), time.min))
+    if params.get('edition'):
+        lookups['edition__name__iexact'] = params['edition']
+    return lookups
+
+
+def export_games(filters):
+    return Game.objects.filter(is_active=True, **filters) \
+                       .order_by('number') \
+                       .values_list(*(lookup for _, lookup in GAME_COLUMNS))
+
+
+def export_scoresheets(filters):
+    filters = {'game__' + lookup: value for lookup, value in filters.items()}
+    is_winner = Case(When(game__winning_scoresheet=F('pk'), then=Value(True)),
+                     default=Value(False), output_field=BooleanField())
+    return Scoresheet.objects.filter(is_active=True, game__is_active=True, **filters) \
+                             .annotate(is_winner=is_winner) \
+                             .order_by('game__number', 'start_position') \
+                             .values_list(*(lookup for _, lookup in SCORESHEET_COLUMNS))
+
+
+def csv_lines(queryset, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in columns])
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield writer.writerow([flatten(value) for value in row])
+
+
+def ndjson_lines(queryset, columns):
+    headers = [header for header, _ in columns]
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield json.dumps(dict(zip(headers, map(flatten, row)))) + '\n'
@@ -0,0 +1,122 @@
+"""Synthetic game histories for load testing and benchmarks.
+
+Rows are written with ``bulk_create`` in batches, bypassing ``Game.save`` and the
+incremental signal receivers, so the derived tables are rebuilt once at the end (or, for
+large histories, separately with ``rebuild_player_stats`` and ``rebuild_ratings``).
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_pages
+from .models import Player, Location, Edition, Game, Scoresheet
+from .signals import rebuild_derived_tables
+
+FIRST_NAMES = ['Alex', 'Blair', 'Casey', 'Devon', 'Emery', 'Finley', 'Gray', 'Harper', 'Indy', 'Jordan',
+               'Kai', 'Logan', 'Morgan', 'Noel', 'Oakley', 'Parker', 'Quinn', 'Riley', 'Sawyer', 'Taylor']
+
+PLAYER_COUNTS = {
+    Edition.TWO: (2, 4),
+    Edition.FOUR: (3, 4),
+    Edition.SIX: (5, 6),
+}
+
+
+def ensure_players(count):
+    players = list(Player.objects.filter(is_active=True))
+    for i in range(len(players), count):
+        first_name = FIRST_NAMES[i % len(FIRST_NAMES)]
+        players.append(Player.objects.create_user(
+            email='{}.{}@example.com'.format(first_name.lower(), i),
+            first_name=first_name, last_name='Player{}'.format(i)))
+    return players[:count]
+
+
+def ensure_editions():
+    if not Edition.objects.filter(is_active=True).exists():
+        call_command('loaddata', 'editions', verbosity=0)
+    return list(Edition.objects.filter(is_active=True))
+
+
+def ensure_locations():
+    if not Location.objects.filter(is_active=True).exists():
+        call_command('loaddata', 'locations', verbosity=0)
+    return list(Location.objects.filter(is_active=True))
+
+
+def build_game(rng, date_start, edition, location, players, min_players=None, max_players=None):
+    """Return an unsaved, unnumbered game and its scoresheets, with the winner already chosen."""
+    low, high = PLAYER_COUNTS.get(edition.max_players, (3, 4))
+    low, high = max(low, min_players or low), min(high, max_players or high)
+    seats = rng.sample(players, min(len(players), rng.randint(low, max(low, high))))
+    colors = rng.sample([color for color, _ in Scoresheet.PLAYER_COLORS], len(seats))
+
+    duration = timedelta(minutes=rng.randint(35, 150))
+    game = Game(id=uuid.uuid4(), date_start=date_start, date_finish=date_start + duration,
+                duration=duration, edition_id=edition.pk, location_id=location.pk)
+
+    # The winner reaches the edition's target, everyone else falls short of it
+    winner = rng.randrange(len(seats))
+    scoresheets = []
+    for position, (player, color) in enumerate(zip(seats, colors)):
+        points = edition.points + rng.randint(0, 1) if position == winner \
+            else rng.randint(max(2, edition.points // 3), edition.points - 1)
+        cities = rng.randint(0, min(4, points // 2))
+        settlements = max(0, min(5, points - 2 * cities))
+        scoresheets.append(Scoresheet(
+            id=uuid.uuid4(), game_id=game.id, player_id=player.pk, color=color, start_position=position + 1,
+            total_points=points, num_settlements=settlements, num_cities=cities,
+            num_vpcards=rng.randint(0, 2), num_chits=rng.randint(0, 3),
+            longest_road=rng.random() < 0.3, largest_army=rng.random() < 0.25,
+            metro_science=rng.random() < 0.1, metro_politics=rng.random() < 0.1,
+            metro_trade=rng.random() < 0.1, merchant=rng.random() < 0.15,
+            harbormaster=rng.random() < 0.05))
+    game.winning_scoresheet_id = max(scoresheets, key=lambda s: s.total_points).id
+    return game, scoresheets
+
+
+def generate_history(num_games, num_players=8, seed=None, batch_size=2000, min_players=None,
+                     max_players=None, start=None, stdout=None, rebuild_derived=True):
+    """Append ``num_games`` synthetic games to the database and return (games, scoresheets) created.
+
+    The derived tables are rebuilt from scratch afterwards, which costs more than the inserts on
+    large histories. With ``rebuild_derived`` False they are left stale, to be rebuilt separately.
+    """
+    rng = random.Random(seed)
+    players = ensure_players(num_players)
+    editions = ensure_editions()
+    locations = ensure_locations()
+
+    start = start or timezone.make_aware(datetime(2015, 1, 1, 18, 0))
+    spacing = (timezone.now() - start) / max(num_games, 1)
+
+    created_games = created_scoresheets = 0
+    for batch_start in range(0, num_games, batch_size):
+        games, scoresheets = [], []
+        for i in range(batch_start, min(batch_start + batch_size, num_games)):
+            game, sheets = build_game(rng, start + spacing * i,
+                                      rng.choice(editions), rng.choice(locations), players,
+                                      min_players=min_players, max_players=max_players)
+            games.append(game)
+            scoresheets.extend(sheets)
+
+        with transaction.atomic():
+            # One counter update per batch instead of one per Game.save()
+            for number, game in enumerate(games, start=Game.allocate_numbers(len(games))):
+                game.number = number
+            Game.objects.bulk_create(games, batch_size=batch_size)
+            Scoresheet.objects.bulk_create(scoresheets, batch_size=batch_size)
+        created_games += len(games)
+        created_scoresheets += len(scoresheets)
+        if stdout is not None:
+            stdout.write('  {} / {} games'.format(created_games, num_games))
+
+    if rebuild_derived:
+        rebuild_derived_tables()
+    else:
+        invalidate_pages()
+    return created_games, created_scoresheets
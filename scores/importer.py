@@ -0,0 +1,191 @@
+"""Streaming importer for historical game logs.
+
+Two formats are accepted:
+
+* CSV with one scoresheet per row. Rows belonging to the same game share a ``game``
+  reference and must be contiguous; game level columns are read from the first row.
+* NDJSON with one game per line and its scoresheets nested under ``scoresheets``.
+
+Players are resolved by email, editions and locations by name, and a scoresheet without
+a color gets the first one nobody else in its game has. Games are checked the way the
+admin checks recorded ones (recording.validate_game). Invalid games are reported and
+skipped; everything else is inserted in batched transactions, so memory stays flat
+regardless of the size of the input.
+
+Imported games are numbered after every game already recorded, in input order, so a
+backfilled game carries a higher number than newer ones. Lists that mean "most recent
+first" order by ``date_start`` and use the number only to break ties.
+"""
+import csv
+import json
+import uuid
+from itertools import groupby
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from pytz.exceptions import InvalidTimeError
+
+from .models import Player, Location, Edition, Game, Scoresheet
+from .recording import RecordingError, validate_game
+from .signals import rebuild_derived_tables
+
+GAME_FIELDS = ('date_start', 'date_finish', 'edition', 'location')
+INTEGER_FIELDS = ('start_position', 'total_points', 'num_settlements', 'num_cities', 'num_vpcards', 'num_chits')
+BOOLEAN_FIELDS = ('longest_road', 'largest_army', 'metro_science', 'metro_politics', 'metro_trade',
+                  'merchant', 'harbormaster')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't', 'x')
+COLORS = {code: code for code, _ in Scoresheet.PLAYER_COLORS}
+COLORS.update({name.lower(): code for code, name in Scoresheet.PLAYER_COLORS})
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(stream):
+    """Yield (line number, game dict) from a CSV stream with one scoresheet per row."""
+    reader = csv.DictReader(stream)
+    rows = ((reader.line_num, row) for row in reader)
+    for reference, group in groupby(rows, key=lambda item: item[1].get('game')):
+        group = list(group)
+        line, first = group[0]
+        game = {field: first.get(field) for field in GAME_FIELDS}
+        game['scoresheets'] = [row for _, row in group]
+        yield line, game
+
+
+def read_ndjson(stream):
+    """Yield (line number, game dict) from a stream with one JSON game per line."""
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            game = json.loads(text)
+        except ValueError as exc:
+            yield line, exc
+            continue
+        yield line, game
+
+
+class GameImporter:
+    def __init__(self, batch_size=1000, dry_run=False, on_error=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.on_error = on_error
+        self.players = {email.lower(): pk for pk, email in Player.objects.values_list('pk', 'email')}
+        self.editions = {name.lower(): pk for pk, name in Edition.objects.values_list('pk', 'name')}
+        self.locations = {name.lower(): pk for pk, name in Location.objects.values_list('pk', 'name')}
+        self.games = []
+        self.scoresheets = []
+        self.imported = 0
+        self.errors = 0
+
+    def lookup(self, mapping, value, label):
+        try:
+            return mapping[str(value or '').strip().lower()]
+        except KeyError:
+            raise RowError('unknown {} "{}"'.format(label, value))
+
+    def parse_datetime(self, value, label):
+        try:
+            parsed = parse_datetime(str(value or '').strip())
+        except ValueError:
+            # Well formed but impossible, e.g. February 30th
+            parsed = None
+        if parsed is None:
+            raise RowError('{} "{}" is not a valid date and time'.format(label, value))
+        if timezone.is_naive(parsed):
+            try:
+                parsed = timezone.make_aware(parsed)
+            except InvalidTimeError:
+                raise RowError('{} "{}" is skipped or repeated by a daylight saving change; '
+                               'give its UTC offset'.format(label, value))
+        return parsed
+
+    def parse_boolean(self, value):
+        return value if isinstance(value, bool) else str(value or '').strip().lower() in TRUE_VALUES
+
+    def parse_scoresheet(self, game, data):
+        if not isinstance(data, dict):
+            raise RowError('each scoresheet must be an object')
+        values = {}
+        for field in INTEGER_FIELDS:
+            raw = data.get(field)
+            if raw in (None, ''):
+                continue
+            try:
+                values[field] = int(raw)
+            except (TypeError, ValueError):
+                raise RowError('{} "{}" is not a number'.format(field, raw))
+        for field in BOOLEAN_FIELDS:
+            values[field] = self.parse_boolean(data.get(field))
+
+        raw_color = str(data.get('color') or '').strip()
+        color = COLORS.get(raw_color.upper()) or COLORS.get(raw_color.lower())
+        if raw_color and color is None:
+            raise RowError('unknown color "{}"'.format(data.get('color')))
+
+        scoresheet = Scoresheet(id=uuid.uuid4(), game_id=game.id, color=color,
+                                player_id=self.lookup(self.players, data.get('player'), 'player'), **values)
+        scoresheet.is_winner = self.parse_boolean(data.get('winner'))
+        return scoresheet
+
+    def parse_game(self, data):
+        if isinstance(data, Exception):
+            raise RowError('invalid JSON: {}'.format(data))
+        if not isinstance(data, dict):
+            raise RowError('each game must be an object')
+        game = Game(id=uuid.uuid4(),
+                    date_start=self.parse_datetime(data.get('date_start'), 'date_start'),
+                    date_finish=self.parse_datetime(data.get('date_finish'), 'date_finish'),
+                    edition_id=self.lookup(self.editions, data.get('edition'), 'edition'),
+                    location_id=self.lookup(self.locations, data.get('location'), 'location'))
+        game.duration = game.date_finish - game.date_start
+
+        scoresheets = [self.parse_scoresheet(game, sheet) for sheet in data.get('scoresheets') or []]
+        taken = {s.color for s in scoresheets}
+        free_colors = (code for code, _ in Scoresheet.PLAYER_COLORS if code not in taken)
+        for scoresheet in scoresheets:
+            if scoresheet.color is None:
+                scoresheet.color = next(free_colors, None)
+        try:
+            game.winning_scoresheet_id = validate_game(game, scoresheets).id
+        except RecordingError as exc:
+            raise RowError(str(exc))
+        return game, scoresheets
+
+    def add(self, line, data):
+        try:
+            game, scoresheets = self.parse_game(data)
+        except RowError as exc:
+            self.errors += 1
+            if self.on_error is not None:
+                self.on_error(line, str(exc))
+            return
+        self.games.append(game)
+        self.scoresheets.extend(scoresheets)
+        if len(self.games) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.games:
+            return
+        if not self.dry_run:
+            with transaction.atomic():
+                for number, game in enumerate(self.games, start=Game.allocate_numbers(len(self.games))):
+                    game.number = number
+                Game.objects.bulk_create(self.games)
+                Scoresheet.objects.bulk_create(self.scoresheets)
+        self.imported += len(self.games)
+        self.games = []
+        self.scoresheets = []
+
+    def run(self, games):
+        """Import (line, game) pairs from one of the readers and return (imported, errors) counts."""
+        for line, data in games:
+            self.add(line, data)
+        self.flush()
+        if self.imported and not self.dry_run:
+            rebuild_derived_tables()
+        return self.imported, self.errors
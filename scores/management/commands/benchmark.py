@@ -0,0 +1,127 @@
+import json
+import subprocess
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from scores import urls as score_urls
+from scores.cache import page_cache
+from scores.history import generate_history
+from scores.models import Player, Game
+from scores.profiling import RequestProfile, current_profile, instrument_connection
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Seed throwaway databases with synthetic histories and time every view in scores/urls.py. '
+            'Results are written as one JSON object per history size.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+                            help='History sizes (number of games) to benchmark.')
+        parser.add_argument('--players', type=int, default=8, help='Number of players in the seeded group.')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed requests per view; the best is kept.')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the generated histories.')
+        parser.add_argument('--output', help='Append results to this file (JSON lines) instead of stdout.')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database between runs.')
+
+    def view_urls(self):
+        player = Player.objects.filter(is_active=True).first()
+        game = Game.objects.filter(is_active=True).first()
+        kwargs = {'player': player.pk, 'game': game.pk}
+        for pattern in score_urls.urlpatterns:
+            if isinstance(pattern, URLPattern):
+                args = {name: kwargs[name] for name in pattern.pattern.converters}
+                yield pattern.name, reverse(pattern.name, kwargs=args)
+
+    def time_view(self, url, repeat):
+        best = None
+        for _ in range(repeat):
+            # Measure the uncached render; the page cache would otherwise hide every regression
+            page_cache().clear()
+            # Count through the profiling hooks rather than CaptureQueriesContext, which only sees this
+            # thread's connection and would miss the queries the async views run on the pool
+            for conn in connections.all():
+                instrument_connection(conn)
+            profile = RequestProfile()
+            token = current_profile.set(profile)
+            started = time.perf_counter()
+            try:
+                response = self.client.get(url)
+                if response.streaming:
+                    # Exports run their query while the body is consumed
+                    for _ in response.streaming_content:
+                        pass
+                status = response.status_code
+            except Exception as exc:
+                # DEBUG_PROPAGATE_EXCEPTIONS re-raises view errors; record them and keep going with
+                # a new client, since Client re-raises a stored failure on its next request
+                self.client = Client()
+                return {'status': 500, 'error': repr(exc), 'wall_ms': None, 'queries': None, 'sql_ms': None}
+            finally:
+                current_profile.reset(token)
+            wall = time.perf_counter() - started
+            sample = {
+                'status': status,
+                'wall_ms': round(wall * 1000, 2),
+                'queries': profile.queries,
+                'sql_ms': round(profile.sql_time * 1000, 2),
+            }
+            if best is None or sample['wall_ms'] < best['wall_ms']:
+                best = sample
+        return best
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        connection_created.connect(instrument_connection, dispatch_uid='scores.profiling')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            for size in options['sizes']:
+                self.benchmark_size(size, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+    def benchmark_size(self, size, options):
+        self.stderr.write('Seeding {} games...'.format(size))
+        call_command('flush', interactive=False, verbosity=0)
+        started = time.perf_counter()
+        games, scoresheets = generate_history(size, num_players=options['players'], seed=options['seed'],
+                                              min_players=3, max_players=6)
+        seed_seconds = time.perf_counter() - started
+
+        self.client = Client()
+        results = {
+            'run_at': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'games': games,
+            'scoresheets': scoresheets,
+            'seed_seconds': round(seed_seconds, 2),
+            'views': {},
+        }
+        for name, url in self.view_urls():
+            results['views'][name] = dict(url=url, **self.time_view(url, options['repeat']))
+            self.stderr.write('  {:<20} {status} {wall_ms!s:>10} ms {queries!s:>5} queries {sql_ms!s:>10} ms SQL'.format(
+                name, **results['views'][name]))
+
+        line = json.dumps(results, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'a') as output:
+                output.write(line + '\n')
+        else:
+            self.stdout.write(line)
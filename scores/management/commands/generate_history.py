@@ -0,0 +1,45 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from scores.history import generate_history
+
+
+class Command(BaseCommand):
+    help = ('Append a synthetic history of players, locations, editions, games and scoresheets for '
+            'load testing. Existing data is kept; game numbers continue after the highest one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('games', type=int, help='Number of games to create.')
+        parser.add_argument('--players', type=int, default=8,
+                            help='Size of the playing group; missing players are created.')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible histories.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Games written per transaction.')
+        parser.add_argument('--start', help='Date of the first game (YYYY-MM-DD); games are spread from '
+                                            'there to now. Defaults to 2015-01-01.')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Leave the stats, rollup and rating tables stale instead of rebuilding them; '
+                                 'run rebuild_player_stats and rebuild_ratings afterwards.')
+
+    def handle(self, *args, **options):
+        if options['games'] < 1:
+            raise CommandError('The number of games must be positive.')
+        if options['players'] < 2:
+            raise CommandError('A game needs at least two players.')
+
+        start = None
+        if options['start']:
+            try:
+                start = timezone.make_aware(datetime.strptime(options['start'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--start must be a date formatted as YYYY-MM-DD.')
+
+        started = time.perf_counter()
+        games, scoresheets = generate_history(options['games'], num_players=options['players'],
+                                              seed=options['seed'], batch_size=options['batch_size'],
+                                              start=start, stdout=self.stdout,
+                                              rebuild_derived=not options['skip_derived'])
+        self.stdout.write(self.style.SUCCESS('Created {} games and {} scoresheets in {:.1f}s.'.format(
+            games, scoresheets, time.perf_counter() - started)))
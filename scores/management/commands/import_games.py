@@ -0,0 +1,50 @@
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scores.importer import GameImporter, read_csv, read_ndjson
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+class Command(BaseCommand):
+    help = ('Stream historical games from a CSV (one scoresheet per row, grouped by a "game" column) '
+            'or NDJSON (one game per line) file. Invalid games are reported and skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or "-" for standard input.')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='Input format; guessed from the file extension when omitted.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Games inserted per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without writing anything.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError('Cannot guess the format of "{}"; pass --format.'.format(path))
+
+        def report(line, message):
+            self.stderr.write('line {}: {}'.format(line, message))
+
+        importer = GameImporter(batch_size=options['batch_size'], dry_run=options['dry_run'], on_error=report)
+        started = time.perf_counter()
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+            imported, errors = importer.run(READERS[file_format](stream))
+        else:
+            try:
+                with open(path, encoding='utf-8', newline='') as stream:
+                    imported, errors = importer.run(READERS[file_format](stream))
+            except OSError as exc:
+                raise CommandError(exc)
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style('{} {} games in {:.1f}s; {} skipped with errors.'.format(
+            verb, imported, time.perf_counter() - started, errors)))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from scores.models import PlayerStats, WinStreak, EditionPlayerRollup, DailyRollup, DailyPlayerRollup
+
+
+class Command(BaseCommand):
+    help = ('Recompute the denormalized PlayerStats, WinStreak, EditionPlayerRollup, DailyRollup and '
+            'DailyPlayerRollup tables from the active games and scoresheets.')
+
+    def handle(self, *args, **options):
+        PlayerStats.objects.refresh()
+        WinStreak.objects.refresh()
+        EditionPlayerRollup.objects.refresh()
+        DailyRollup.objects.refresh()
+        DailyPlayerRollup.objects.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt stats for {} players and {} days.'.format(PlayerStats.objects.count(),
+                                                               DailyRollup.objects.count())))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scores.cache import invalidate_pages
+from scores.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = ('Replay every game to rebuild the overall and per-edition Elo rating history. '
+            'Editions are independent streams and can be rebuilt in parallel.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes; each rebuilds one rating stream at a time.')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1.')
+        started = time.perf_counter()
+        rows = rebuild_ratings(processes=options['processes'])
+        invalidate_pages()
+        self.stdout.write(self.style.SUCCESS('Wrote {} rating history rows in {:.1f}s.'.format(
+            rows, time.perf_counter() - started)))
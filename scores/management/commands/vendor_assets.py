@@ -0,0 +1,43 @@
+import os
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scores.assets import ASSETS, STATIC_DIR, integrity_matches
+
+
+class Command(BaseCommand):
+    help = ('Download the pinned front-end libraries in scores.assets into scores/static/scores/vendor, '
+            'checking them against their integrity hashes. Run collectstatic afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', metavar='name',
+                            help='Assets to vendor: {}. All of them when omitted.'.format(', '.join(ASSETS)))
+        parser.add_argument('--force', action='store_true', help='Download files that are already vendored.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(ASSETS)
+        if unknown:
+            raise CommandError('Unknown assets: {}.'.format(', '.join(sorted(unknown))))
+
+        downloaded = 0
+        for name in options['names'] or ASSETS:
+            asset = ASSETS[name]
+            for path, url in asset.files():
+                target = os.path.join(STATIC_DIR, *path.split('/'))
+                if os.path.exists(target) and not options['force']:
+                    continue
+                try:
+                    with urllib.request.urlopen(url, timeout=30) as response:
+                        content = response.read()
+                except OSError as exc:
+                    raise CommandError('{}: {}'.format(url, exc))
+                if path == asset.static_path and asset.integrity and not integrity_matches(content, asset.integrity):
+                    raise CommandError('{} does not match its pinned integrity hash.'.format(url))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as stream:
+                    stream.write(content)
+                downloaded += 1
+                self.stdout.write('{} -> {}'.format(url, path))
+
+        self.stdout.write(self.style.SUCCESS('Downloaded {} files.'.format(downloaded)))
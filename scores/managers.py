@@ -1,7 +1,283 @@
-from django.db import models
-from django.db.models.functions import Lower, Length
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import or_
 
+from django.db import connections, models, transaction
+from django.db.models import Count, Max, Q, F, Sum, Value, DurationField, IntegerField
+from django.db.models.functions import Coalesce, Lower, Length, TruncDate
+from django.utils import timezone
 
-class OrderedEditionManager(models.Manager):
+
+class PlayedQuerySet(models.QuerySet):
+    """Editions and locations, which games are played with or at."""
+
+    def with_stats(self):
+        """Annotate times_played, total_duration and last_played_at over the active games.
+
+        Everything comes from one grouped join on the games, so templates can show the
+        totals of every row without a COUNT and a SUM per row.
+        """
+        active = Q(game__is_active=True)
+        return self.annotate(times_played=Count('game', filter=active),
+                             total_duration=Sum('game__duration', filter=active),
+                             last_played_at=Max('game__date_start', filter=active))
+
+
+class PlayerQuerySet(models.QuerySet):
+    def with_stats(self):
+        """The PlayedQuerySet.with_stats annotations for players.
+
+        They are read from the player's PlayerStats row, which already holds the grouped
+        totals, so this is a join rather than a GROUP BY over the scoresheets.
+        """
+        return self.annotate(times_played=Coalesce('stats__games_played', Value(0, output_field=IntegerField())),
+                             total_duration=Coalesce('stats__total_duration',
+                                                     Value(timedelta(), output_field=DurationField())),
+                             last_played_at=F('stats__last_played'))
+
+
+class OrderedEditionManager(models.Manager.from_queryset(PlayedQuerySet)):
     def get_queryset(self):
         return super().get_queryset().order_by(Lower('game_type'), Length('game_type'))
+
+
+class PlayerStatsManager(models.Manager):
+    use_in_migrations = True
+
+    def refresh(self, player_ids=None):
+        """Recompute the stats rows for the given players, or for everyone when no ids are given.
+
+        All totals come from one grouped query over the active scoresheets, so the cost is
+        proportional to the scoresheets of the affected players only.
+        """
+        apps = self.model._meta.apps
+        Player = apps.get_model('scores', 'Player')
+        Scoresheet = apps.get_model('scores', 'Scoresheet')
+
+        players = Player.objects.all()
+        scoresheets = Scoresheet.objects.filter(is_active=True, game__is_active=True)
+        if player_ids is not None:
+            player_ids = {pk for pk in player_ids if pk is not None}
+            if not player_ids:
+                return
+            players = players.filter(pk__in=player_ids)
+            scoresheets = scoresheets.filter(player__in=player_ids)
+
+        totals = scoresheets.values('player') \
+                            .order_by() \
+                            .annotate(games_played=Count('pk'),
+                                      games_won=Count('pk', filter=Q(game__winning_scoresheet=F('pk'))),
+                                      total_points=Sum('total_points'),
+                                      total_duration=Sum('game__duration'),
+                                      last_played=Max('game__date_start'))
+        totals = {row.pop('player'): row for row in totals}
+
+        rows = []
+        for player_id in players.values_list('pk', flat=True):
+            row = totals.get(player_id, {})
+            games_played = row.get('games_played', 0)
+            games_won = row.get('games_won', 0)
+            rows.append(self.model(player_id=player_id,
+                                   games_played=games_played,
+                                   games_won=games_won,
+                                   games_lost=games_played - games_won,
+                                   total_points=row.get('total_points') or 0,
+                                   total_duration=row.get('total_duration') or timedelta(),
+                                   last_played=row.get('last_played')))
+
+        with transaction.atomic(using=self.db):
+            stale = self.all() if player_ids is None else self.filter(player__in=player_ids)
+            stale.delete()
+            self.bulk_create(rows, batch_size=500)
+
+
+class CounterManager(models.Manager):
+    use_in_migrations = True
+
+    def allocate(self, name, count=1, seed=None):
+        """Reserve ``count`` consecutive values of the named counter and return the first one.
+
+        The counter row is incremented before it is read, so the UPDATE's row lock serializes
+        concurrent callers until their transaction ends. Call this inside the transaction that
+        writes the numbered rows: a rollback then returns the block and numbers stay gap-free.
+        ``seed`` is called once to find the starting value if the row does not exist yet.
+        """
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        with transaction.atomic(using=self.db):
+            counter = self.filter(name=name)
+            if not counter.update(value=F('value') + count):
+                self.get_or_create(name=name, defaults={'value': seed() if seed else 0})
+                counter.update(value=F('value') + count)
+            return counter.values_list('value', flat=True).get() - count + 1
+
+
+class WinStreakManager(models.Manager):
+    use_in_migrations = True
+
+    # Gaps and islands: number each player's games in date order, keep the wins, and the
+    # difference between a win's game number and its win number is constant along a streak
+    STREAKS_SQL = """
+        WITH results AS (
+            SELECT s.player_id,
+                   CASE WHEN g.winning_scoresheet_id = s.id THEN 1 ELSE 0 END AS won,
+                   ROW_NUMBER() OVER (PARTITION BY s.player_id ORDER BY g.date_start, g.number) AS seq,
+                   COUNT(*) OVER (PARTITION BY s.player_id) AS games
+            FROM {scoresheet} s
+            INNER JOIN {game} g ON g.id = s.game_id
+            WHERE s.is_active AND g.is_active {players}
+        ),
+        islands AS (
+            SELECT player_id, seq, games,
+                   seq - ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY seq) AS island
+            FROM results
+            WHERE won = 1
+        ),
+        streaks AS (
+            SELECT player_id, COUNT(*) AS length, MAX(seq) AS last_seq, MAX(games) AS games
+            FROM islands
+            GROUP BY player_id, island
+        )
+        SELECT player_id,
+               MAX(CASE WHEN last_seq = games THEN length ELSE 0 END) AS current_streak,
+               MAX(length) AS longest_streak
+        FROM streaks
+        GROUP BY player_id
+    """
+
+    def refresh(self, player_ids=None):
+        """Recompute current and longest win streaks for the given players, or for everyone.
+
+        The streaks come from one window-function query over the players' scoresheets;
+        players without a win get a row of zeros.
+        """
+        apps = self.model._meta.apps
+        Player = apps.get_model('scores', 'Player')
+        Scoresheet = apps.get_model('scores', 'Scoresheet')
+        Game = apps.get_model('scores', 'Game')
+        connection = connections[self.db]
+        player_pk = Player._meta.pk
+
+        players = Player.objects.all()
+        params = []
+        player_filter = ''
+        if player_ids is not None:
+            player_ids = {pk for pk in player_ids if pk is not None}
+            if not player_ids:
+                return
+            players = players.filter(pk__in=player_ids)
+            params = [player_pk.get_db_prep_value(pk, connection) for pk in player_ids]
+            player_filter = 'AND s.player_id IN ({})'.format(', '.join(['%s'] * len(params)))
+
+        sql = self.STREAKS_SQL.format(scoresheet=connection.ops.quote_name(Scoresheet._meta.db_table),
+                                      game=connection.ops.quote_name(Game._meta.db_table),
+                                      players=player_filter)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            streaks = {player_pk.to_python(player_id): (current, longest)
+                       for player_id, current, longest in cursor.fetchall()}
+
+        rows = []
+        for player_id in players.values_list('pk', flat=True):
+            current, longest = streaks.get(player_id, (0, 0))
+            rows.append(self.model(player_id=player_id, current_streak=current, longest_streak=longest))
+
+        with transaction.atomic(using=self.db):
+            stale = self.all() if player_ids is None else self.filter(player__in=player_ids)
+            stale.delete()
+            self.bulk_create(rows, batch_size=500)
+
+
+class EditionPlayerRollupManager(models.Manager):
+    use_in_migrations = True
+
+    def refresh(self, player_ids=None):
+        """Recompute the (edition, player) point rollups for the given players, or for everyone.
+
+        Count, sum and sum of squares are enough to derive averages and standard deviations
+        for any set of players, so the rows can be added together by edition at read time.
+        """
+        Scoresheet = self.model._meta.apps.get_model('scores', 'Scoresheet')
+
+        scoresheets = Scoresheet.objects.filter(is_active=True, game__is_active=True)
+        if player_ids is not None:
+            player_ids = {pk for pk in player_ids if pk is not None}
+            if not player_ids:
+                return
+            scoresheets = scoresheets.filter(player__in=player_ids)
+
+        rows = [self.model(edition_id=row['game__edition'], player_id=row['player'],
+                           scoresheets=row['scoresheets'], total_points=row['points'] or 0,
+                           total_points_squared=row['points_squared'] or 0)
+                for row in scoresheets.values('game__edition', 'player')
+                                      .order_by()
+                                      .annotate(scoresheets=Count('pk'),
+                                                points=Sum('total_points'),
+                                                points_squared=Sum(F('total_points') * F('total_points')))]
+
+        with transaction.atomic(using=self.db):
+            stale = self.all() if player_ids is None else self.filter(player__in=player_ids)
+            stale.delete()
+            self.bulk_create(rows, batch_size=500)
+
+
+def local_days_filter(days, field='date_start'):
+    """Q matching ``field`` on any of the given local dates, as index-friendly datetime ranges."""
+    def day_range(day):
+        start = timezone.make_aware(datetime.combine(day, time.min), timezone.get_default_timezone())
+        end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min),
+                                  timezone.get_default_timezone())
+        return Q(**{field + '__gte': start, field + '__lt': end})
+    return reduce(or_, (day_range(day) for day in sorted(days)))
+
+
+class DailyRollupManager(models.Manager):
+    """Shared refresh for the tables rolled up by local (TIME_ZONE) calendar day.
+
+    This is a base class. Subclasses define ``rows(games)``, which returns unsaved model
+    instances for ``games``: a queryset of the active games on the days being refreshed,
+    annotated with their local ``day`` and without ordering. refresh() deletes the stored
+    rows of those days first, so every day must get all of its rows.
+    """
+    use_in_migrations = True
+
+    def refresh(self, days=None):
+        """Recompute the rollup rows for the given local dates, or for every day when none are given."""
+        Game = self.model._meta.apps.get_model('scores', 'Game')
+
+        games = Game.objects.filter(is_active=True)
+        if days is not None:
+            days = {day for day in days if day is not None}
+            if not days:
+                return
+            games = games.filter(local_days_filter(days))
+
+        # Days are always the project's local dates, whatever timezone the request activated
+        with timezone.override(timezone.get_default_timezone()):
+            rows = self.rows(games.annotate(day=TruncDate('date_start')).order_by())
+
+        with transaction.atomic(using=self.db):
+            stale = self.all() if days is None else self.filter(day__in=days)
+            stale.delete()
+            self.bulk_create(rows, batch_size=500)
+
+
+class DailyGameRollupManager(DailyRollupManager):
+    def rows(self, games):
+        return [self.model(day=row['day'], games=row['games'], total_duration=row['total_duration'])
+                for row in games.values('day').annotate(games=Count('pk'), total_duration=Sum('duration'))]
+
+
+class DailyPlayerRollupManager(DailyRollupManager):
+    def rows(self, games):
+        Scoresheet = self.model._meta.apps.get_model('scores', 'Scoresheet')
+        scoresheets = Scoresheet.objects.filter(is_active=True, game__in=games.values('pk')) \
+                                        .annotate(day=TruncDate('game__date_start')) \
+                                        .values('day', 'player') \
+                                        .order_by() \
+                                        .annotate(games=Count('pk'),
+                                                  wins=Count('pk', filter=Q(game__winning_scoresheet=F('pk'))),
+                                                  points=Sum('total_points'))
+        return [self.model(day=row['day'], player_id=row['player'], games=row['games'], wins=row['wins'],
+                           points=row['points'] or 0)
+                for row in scoresheets]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:28
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+import scores.managers
+
+
+def populate_player_stats(apps, schema_editor):
+    PlayerStats = apps.get_model('scores', 'PlayerStats')
+    PlayerStats.objects.refresh()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0006_auto_20200117_1625'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='scores.player')),
+                ('games_played', models.IntegerField(default=0)),
+                ('games_won', models.IntegerField(default=0)),
+                ('games_lost', models.IntegerField(default=0)),
+                ('total_points', models.IntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('last_played', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'player stats',
+                'verbose_name_plural': 'player stats',
+            },
+            managers=[
+                ('objects', scores.managers.PlayerStatsManager()),
+            ],
+        ),
+        migrations.RunPython(populate_player_stats, migrations.RunPython.noop),
+    ]
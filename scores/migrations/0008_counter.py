@@ -0,0 +1,33 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:37
+
+from django.db import migrations, models
+from django.db.models import Max
+import scores.managers
+
+
+def seed_game_number(apps, schema_editor):
+    Counter = apps.get_model('scores', 'Counter')
+    Game = apps.get_model('scores', 'Game')
+    largest = Game.objects.aggregate(largest=Max('number'))['largest'] or 0
+    Counter.objects.update_or_create(name='game-number', defaults={'value': largest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0007_playerstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            managers=[
+                ('objects', scores.managers.CounterManager()),
+            ],
+        ),
+        migrations.RunPython(seed_game_number, migrations.RunPython.noop),
+    ]
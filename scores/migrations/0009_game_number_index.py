@@ -0,0 +1,18 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0008_counter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='number',
+            field=models.IntegerField(db_index=True, default=1, editable=False),
+        ),
+    ]
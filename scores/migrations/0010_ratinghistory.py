@@ -0,0 +1,47 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import scores.ratings
+
+
+def populate_ratings(apps, schema_editor):
+    scores.ratings.rebuild_ratings(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0009_game_number_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_start', models.DateTimeField()),
+                ('number', models.IntegerField()),
+                ('rating_before', models.FloatField()),
+                ('rating', models.FloatField()),
+                ('edition', models.ForeignKey(blank=True, help_text='Empty for the overall rating stream', null=True, on_delete=django.db.models.deletion.CASCADE, to='scores.edition')),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='scores.game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'rating history',
+                'verbose_name_plural': 'rating history',
+                'ordering': ('date_start', 'number'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ratinghistory',
+            index=models.Index(fields=['edition', 'date_start', 'number'], name='rating_stream_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ratinghistory',
+            index=models.Index(fields=['player', 'edition', 'date_start', 'number'], name='rating_player_stream_idx'),
+        ),
+        migrations.RunPython(populate_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import scores.managers
+
+
+def populate_win_streaks(apps, schema_editor):
+    WinStreak = apps.get_model('scores', 'WinStreak')
+    WinStreak.objects.refresh()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0010_ratinghistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WinStreak',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='streak', serialize=False, to='scores.player')),
+                ('current_streak', models.IntegerField(default=0)),
+                ('longest_streak', models.IntegerField(default=0)),
+            ],
+            managers=[
+                ('objects', scores.managers.WinStreakManager()),
+            ],
+        ),
+        migrations.RunPython(populate_win_streaks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import scores.managers
+
+
+def populate_edition_rollups(apps, schema_editor):
+    EditionPlayerRollup = apps.get_model('scores', 'EditionPlayerRollup')
+    EditionPlayerRollup.objects.refresh()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0011_winstreak'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EditionPlayerRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scoresheets', models.IntegerField(default=0)),
+                ('total_points', models.IntegerField(default=0)),
+                ('total_points_squared', models.BigIntegerField(default=0)),
+                ('edition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='player_rollups', to='scores.edition')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='edition_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('edition', 'player')},
+            },
+            managers=[
+                ('objects', scores.managers.EditionPlayerRollupManager()),
+            ],
+        ),
+        migrations.RunPython(populate_edition_rollups, migrations.RunPython.noop),
+    ]
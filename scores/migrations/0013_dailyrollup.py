@@ -0,0 +1,54 @@
+# Generated by Django 3.1.13 on 2026-10-18 13:14
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import scores.managers
+
+
+def populate_daily_rollups(apps, schema_editor):
+    apps.get_model('scores', 'DailyRollup').objects.refresh()
+    apps.get_model('scores', 'DailyPlayerRollup').objects.refresh()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0012_editionplayerrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('games', models.IntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+            ],
+            options={
+                'ordering': ('day',),
+            },
+            managers=[
+                ('objects', scores.managers.DailyGameRollupManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyPlayerRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('games', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+                ('points', models.IntegerField(default=0)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('day', 'player')},
+            },
+            managers=[
+                ('objects', scores.managers.DailyPlayerRollupManager()),
+            ],
+        ),
+        migrations.RunPython(populate_daily_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.13 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scores', '0013_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(is_active=True), fields=['number', 'id'], name='game_active_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(is_active=True), fields=['date_start', 'number'], name='game_active_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(is_active=True), fields=['edition', 'date_start'], name='game_active_edition_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(is_active=True), fields=['location', 'date_start'], name='game_active_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scoresheet',
+            index=models.Index(condition=models.Q(is_active=True), fields=['player', 'game'], name='scoresheet_active_player_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scoresheet',
+            index=models.Index(condition=models.Q(is_active=True), fields=['game', 'total_points'], name='scoresheet_active_game_idx'),
+        ),
+    ]
@@ -1,15 +1,16 @@
 import uuid
 from datetime import time, timedelta
 
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import Q, Sum
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
 
-from .managers import OrderedEditionManager
+from .managers import (PlayedQuerySet, PlayerQuerySet, OrderedEditionManager, PlayerStatsManager, CounterManager, WinStreakManager,
+                       EditionPlayerRollupManager, DailyGameRollupManager, DailyPlayerRollupManager)
 
-class UserManager(BaseUserManager):
+class UserManager(BaseUserManager.from_queryset(PlayerQuerySet)):
     """Define a model manager for User model with no username field."""
 
     use_in_migrations = True
@@ -81,37 +82,87 @@ class Player(AbstractUser, BaseModel):
         short_name = '{} {}'.format(self.first_name, self.last_name[0])
         return short_name.strip()
 
+    def get_stats(self):
+        try:
+            return self.stats
+        except PlayerStats.DoesNotExist:
+            return PlayerStats(player=self)
+
     def num_games_played(self):
-        num_games = Scoresheet.objects.filter(is_active=True, player=self.pk).count()
-        return num_games
+        return self.get_stats().games_played
 
     def num_games_won(self):
-        num_games = Game.objects.filter(is_active=True, winning_scoresheet__player=self.pk).count()
-        return num_games
+        return self.get_stats().games_won
 
     def num_games_lost(self):
-        return self.num_games_played() - self.num_games_won()
+        return self.get_stats().games_lost
 
     def win_loss_per(self):
+        stats = self.get_stats()
         per = 0
-        if self.num_games_played() > 0:
-            per = (self.num_games_won() / self.num_games_played()) * 100
+        if stats.games_played > 0:
+            per = (stats.games_won / stats.games_played) * 100
         return "{0:.0f}%".format(per)
 
     def last_played(self):
-        return Scoresheet.objects.filter(is_active=True).order_by('-game__date_start')[0].game.date_start
+        return self.get_stats().last_played
 
     def duration_played(self):
-        sum_duration = Scoresheet.objects.filter(is_active=True, player=self.pk).aggregate(sum=Sum('game__duration'))
-        return sum_duration
+        return {'sum': self.get_stats().total_duration}
+
+
+class PlayerStats(models.Model):
+    """Denormalized per-player totals, kept current by the signals in scores.signals."""
+    player = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='stats')
+    games_played = models.IntegerField(default=0)
+    games_won = models.IntegerField(default=0)
+    games_lost = models.IntegerField(default=0)
+    total_points = models.IntegerField(default=0)
+    total_duration = models.DurationField(default=timedelta)
+    last_played = models.DateTimeField(blank=True, null=True)
+
+    objects = PlayerStatsManager()
+
+    class Meta:
+        verbose_name = 'player stats'
+        verbose_name_plural = 'player stats'
+
+    def __str__(self):
+        return "{} ({} played)".format(self.player_id, self.games_played)
+
+
+class WinStreak(models.Model):
+    """Current and longest run of consecutive wins over the games each player played."""
+    player = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='streak')
+    current_streak = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+
+    objects = WinStreakManager()
+
+    def __str__(self):
+        return "{} ({} current, {} longest)".format(self.player_id, self.current_streak, self.longest_streak)
 
 
+class Counter(models.Model):
+    """A named, monotonically increasing counter; see CounterManager.allocate."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    objects = CounterManager()
+
+    def __str__(self):
+        return "{} = {}".format(self.name, self.value)
+
 
 class Location(BaseModel):
     name = models.CharField("location's nickname", max_length=30, blank=False, null=False)
     latitude = models.CharField(max_length=15, blank=True)
     longitude = models.CharField(max_length=15, blank=True)
 
+    objects = PlayedQuerySet.as_manager()
+
     class Meta:
         ordering = ('name', )
 
@@ -163,7 +214,7 @@ class Edition(BaseModel):
     class Meta:
         ordering = ('game_type', )
 
-    objects = models.Manager()
+    objects = PlayedQuerySet.as_manager()
     ordered_objects = OrderedEditionManager()
 
     def __str__(self):
@@ -183,7 +234,9 @@ class Edition(BaseModel):
 
 
 class Game(BaseModel):
-    number = models.IntegerField(default=1, editable=False, blank=False, null=False)
+    NUMBER_COUNTER = 'game-number'
+
+    number = models.IntegerField(default=1, editable=False, blank=False, null=False, db_index=True)
     date_start = models.DateTimeField('Date', default=timezone.now, blank=False, null=False)
     date_finish = models.DateTimeField('Finished', default=timezone.now, blank=False, null=False)
     duration = models.DurationField('Duration', default=timedelta, editable=False, blank=False, null=False)
@@ -198,22 +251,38 @@ class Game(BaseModel):
 
     class Meta:
         ordering = ('-number', )
-
+        # Partial indexes over the active games, matching the is_active filters in views and stats
+        indexes = [
+            models.Index(fields=['number', 'id'], name='game_active_number_idx', condition=Q(is_active=True)),
+            models.Index(fields=['date_start', 'number'], name='game_active_start_idx', condition=Q(is_active=True)),
+            models.Index(fields=['edition', 'date_start'], name='game_active_edition_idx',
+                         condition=Q(is_active=True)),
+            models.Index(fields=['location', 'date_start'], name='game_active_location_idx',
+                         condition=Q(is_active=True)),
+        ]
+
+    # Derived tables are refreshed by post_save receivers, so keep them in this transaction
+    @transaction.atomic
     def save(self, *args, **kwargs):
         # This means that the model isn't saved to the database yet
         if self._state.adding:
-            # Get the maximum display_id value from the database
-            last_num = Game.objects.all().aggregate(largest=models.Max('number'))['largest']
-
-            # aggregate can return None! Check it first.
-            # If it isn't none, just use the last ID specified (which should be the greatest) and add one to it
-            if last_num is not None:
-                self.number = last_num + 1
+            self.number = Game.allocate_numbers()
 
         self.duration = self.date_finish - self.date_start
 
         super(Game, self).save(*args, **kwargs)
 
+    @staticmethod
+    def allocate_numbers(count=1):
+        """Reserve ``count`` consecutive game numbers and return the first.
+
+        Must run inside the transaction that inserts the games. Numbers are never reused, so
+        deleting a game leaves a gap instead of handing its number to the next game.
+        """
+        def largest_number():
+            return Game.objects.aggregate(largest=models.Max('number'))['largest'] or 0
+        return Counter.objects.allocate(Game.NUMBER_COUNTER, count, seed=largest_number)
+
     def get_formatted_number(self):
         return "{0:0=3d}".format(self.number)
     get_formatted_number.short_description = 'game number'
@@ -245,6 +314,9 @@ class Game(BaseModel):
         return self.duration
 
     def get_scoresheets_count(self):
+        # Prefer the count annotated by list views over a query per row
+        if hasattr(self, 'scoresheets_count'):
+            return self.scoresheets_count
         return Scoresheet.objects.filter(is_active=True).filter(game_id=self.pk).count()
 
 
@@ -290,6 +362,17 @@ class Scoresheet(BaseModel):
 
     class Meta:
         ordering = ('-total_points', )
+        indexes = [
+            models.Index(fields=['player', 'game'], name='scoresheet_active_player_idx',
+                         condition=Q(is_active=True)),
+            models.Index(fields=['game', 'total_points'], name='scoresheet_active_game_idx',
+                         condition=Q(is_active=True)),
+        ]
+
+    # Derived tables are refreshed by post_save receivers, so keep them in this transaction
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        super(Scoresheet, self).save(*args, **kwargs)
 
     def get_display_name(self):
         score_str = "{} ({} VPs)".format(self.player.get_full_name(), self.total_points)
@@ -297,3 +380,84 @@ class Scoresheet(BaseModel):
 
     def __str__(self):
         return self.get_display_name()
+
+
+class RatingHistory(models.Model):
+    """A player's Elo rating after each game, overall (no edition) and per edition.
+
+    Rows are written by scores.ratings and replayed from the earliest affected game when
+    history changes.
+    """
+    player = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ratings')
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='ratings')
+    edition = models.ForeignKey(Edition, on_delete=models.CASCADE, blank=True, null=True,
+                                help_text='Empty for the overall rating stream')
+    date_start = models.DateTimeField()
+    number = models.IntegerField()
+    rating_before = models.FloatField()
+    rating = models.FloatField()
+
+    class Meta:
+        ordering = ('date_start', 'number')
+        verbose_name = 'rating history'
+        verbose_name_plural = 'rating history'
+        indexes = [
+            models.Index(fields=['edition', 'date_start', 'number'], name='rating_stream_idx'),
+            models.Index(fields=['player', 'edition', 'date_start', 'number'], name='rating_player_stream_idx'),
+        ]
+
+    def __str__(self):
+        return "{} {:.0f} after game {}".format(self.player_id, self.rating, self.number)
+
+    @property
+    def delta(self):
+        return self.rating - self.rating_before
+
+
+class EditionPlayerRollup(models.Model):
+    """Per (edition, player) scoresheet count, point sum and sum of squared points."""
+    edition = models.ForeignKey(Edition, on_delete=models.CASCADE, related_name='player_rollups')
+    player = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='edition_rollups')
+    scoresheets = models.IntegerField(default=0)
+    total_points = models.IntegerField(default=0)
+    total_points_squared = models.BigIntegerField(default=0)
+
+    objects = EditionPlayerRollupManager()
+
+    class Meta:
+        unique_together = ('edition', 'player')
+
+    def __str__(self):
+        return "{} / {} ({} scoresheets)".format(self.edition_id, self.player_id, self.scoresheets)
+
+
+class DailyRollup(models.Model):
+    """Active games and time played per local (TIME_ZONE) calendar day."""
+    day = models.DateField(primary_key=True)
+    games = models.IntegerField(default=0)
+    total_duration = models.DurationField(default=timedelta)
+
+    objects = DailyGameRollupManager()
+
+    class Meta:
+        ordering = ('day', )
+
+    def __str__(self):
+        return "{} ({} games)".format(self.day, self.games)
+
+
+class DailyPlayerRollup(models.Model):
+    """Games, wins and points per player and local (TIME_ZONE) calendar day."""
+    day = models.DateField()
+    player = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_rollups')
+    games = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+    points = models.IntegerField(default=0)
+
+    objects = DailyPlayerRollupManager()
+
+    class Meta:
+        unique_together = ('day', 'player')
+
+    def __str__(self):
+        return "{} / {} ({} wins)".format(self.day, self.player_id, self.wins)
@@ -0,0 +1,141 @@
+"""Keyset (cursor) pagination for the long list pages.
+
+Instead of ``COUNT(*)`` and ``OFFSET``, each page remembers the sort key of its first and
+last rows in opaque tokens, and the next page is fetched with a ``WHERE key < last`` filter.
+Every page, however deep, costs one indexed query for ``per_page + 1`` rows.
+"""
+import base64
+import json
+import re
+import uuid
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def cursor_value(value):
+    # Full isoformat rather than DjangoJSONEncoder's, which drops the last microsecond digits
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, [cursor_value(v) for v in values]])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(payload.decode('utf-8'))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    if direction not in ('next', 'previous') or not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(token)
+    return direction, values
+
+
+def estimate_count(queryset):
+    """Planner row estimate for ``queryset`` on PostgreSQL, None elsewhere.
+
+    EXPLAIN does not execute the query, so this stays cheap on any table size.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    match = re.search(r'rows=(\d+)', queryset.order_by().explain())
+    return int(match.group(1)) if match else None
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, keys, estimated_count=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.keys = keys
+        self.estimated_count = estimated_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def cursor_for(self, obj, direction):
+        values = []
+        for key in self.keys:
+            value = obj
+            for attname in key.split('__'):
+                value = getattr(value, attname)
+            values.append(value)
+        return encode_cursor(direction, values)
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return self.cursor_for(self.object_list[-1], 'next')
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return self.cursor_for(self.object_list[0], 'previous')
+        return None
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` on ``ordering``, a unique sort key such as ('-date_start', '-number', '-id').
+
+    Related keys are read back from the page's rows through the same ``__`` path, so they
+    must be reachable without extra queries (use select_related).
+    """
+    def __init__(self, queryset, ordering, per_page, estimate=False):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.keys = [key.lstrip('-') for key in ordering]
+        self.per_page = per_page
+        self.estimate = estimate
+
+    def seek(self, values, forward):
+        """Filter for rows strictly after (or before) ``values`` in the pagination order."""
+        condition = Q()
+        for i, key in enumerate(self.ordering):
+            descending = key.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            step = Q(**{'{}__{}'.format(self.keys[i], lookup): values[i]})
+            for equal_key, equal_value in zip(self.keys[:i], values[:i]):
+                step &= Q(**{equal_key: equal_value})
+            condition |= step
+        return condition
+
+    def get_page(self, cursor=None):
+        """Return the page after or before ``cursor``, or the first page for a missing or bad token."""
+        queryset, direction = self.queryset, None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor, len(self.keys))
+                queryset = queryset.filter(self.seek(values, forward=direction == 'next'))
+            except (InvalidCursor, ValidationError, ValueError, TypeError):
+                # Values of the wrong type only fail once the lookups are prepared
+                queryset, direction = self.queryset, None
+
+        ordering = list(self.ordering)
+        if direction == 'previous':
+            ordering = [key[1:] if key.startswith('-') else '-' + key for key in ordering]
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more, rows = len(rows) > self.per_page, rows[:self.per_page]
+
+        if direction == 'previous':
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, direction == 'next'
+
+        estimated_count = estimate_count(self.queryset) if self.estimate else None
+        return KeysetPage(rows, has_next, has_previous, self.keys, estimated_count)
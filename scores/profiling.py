@@ -0,0 +1,141 @@
+"""Opt-in per-request profiling.
+
+ProfilingMiddleware samples REQUEST_PROFILING_SAMPLE_RATE of requests (0 disables it,
+1 profiles every request). For a sampled request it records the number of queries, the
+time spent in SQL, the slowest query, the view time and the template render time, and
+reports them in a Server-Timing header and as one key=value line on ``infologger``.
+
+Queries and templates are timed by hooks that only do work while a sampled request is
+active in the current context, which includes the pooled queries of the async views.
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+
+logger = logging.getLogger('infologger')
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.view_start = None
+        self.view_time = 0.0
+
+    def add_query(self, sql, duration):
+        # Pooled queries report from several threads at once; their times add up, so the
+        # SQL time of a concurrent page can exceed its view time
+        with self.lock:
+            self.queries += 1
+            self.sql_time += duration
+            if duration > self.slowest_time:
+                self.slowest_time, self.slowest_sql = duration, sql
+
+    def server_timing(self, total):
+        return ', '.join([
+            'sql;dur={:.1f};desc="{} queries"'.format(self.sql_time * 1000, self.queries),
+            'sql-slowest;dur={:.1f}'.format(self.slowest_time * 1000),
+            'view;dur={:.1f}'.format(self.view_time * 1000),
+            'template;dur={:.1f}'.format(self.template_time * 1000),
+            'total;dur={:.1f}'.format(total * 1000),
+        ])
+
+    def log_line(self, request, response, total):
+        return ('method={} path={} status={} total_ms={:.1f} view_ms={:.1f} template_ms={:.1f} '
+                'queries={} sql_ms={:.1f} slowest_ms={:.1f} slowest_sql="{}"').format(
+            request.method, request.path, response.status_code, total * 1000, self.view_time * 1000,
+            self.template_time * 1000, self.queries, self.sql_time * 1000, self.slowest_time * 1000,
+            ' '.join((self.slowest_sql or '').split()).replace('"', '\\"')[:200])
+
+
+def profile_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - start)
+
+
+def instrument_connection(connection, **kwargs):
+    if profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_query)
+
+
+def instrument_templates():
+    """Time Template.render; included templates count towards the outermost one."""
+    render = Template.render
+    if getattr(render, 'profiled', False):
+        return
+
+    def profiled_render(template, context):
+        profile = current_profile.get()
+        if profile is None:
+            return render(template, context)
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(template, context)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_time += time.perf_counter() - start
+
+    profiled_render.profiled = True
+    Template.render = profiled_render
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_templates()
+        connection_created.connect(instrument_connection, dispatch_uid='scores.profiling')
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        for connection in connections.all():
+            instrument_connection(connection)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        end = time.perf_counter()
+        total = end - start
+        if profile.view_start is not None:
+            profile.view_time = end - profile.view_start
+
+        response['Server-Timing'] = profile.server_timing(total)
+        logger.info(profile.log_line(request, response, total))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The view time runs from here to the response, so it includes the view, its
+        # templates and the response handling of any middleware listed below this one
+        profile = current_profile.get()
+        if profile is not None:
+            profile.view_start = time.perf_counter()
@@ -0,0 +1,188 @@
+"""Elo ratings replayed from game results.
+
+Each game is scored as a round robin: every player is compared with every other player by
+finishing order (the winning scoresheet first, then total points) and the usual Elo update
+is applied with K spread over the N - 1 pairings. Ratings form independent streams, one
+overall and one per edition, so each stream can be replayed or rebuilt on its own.
+
+Games are ordered by (date_start, number). Changing a game only rewrites the history from
+that game onward; everything before it is left alone, and each player's rating going into
+the replay is one indexed lookup of their last earlier row.
+"""
+import multiprocessing
+import threading
+from itertools import groupby
+from operator import itemgetter
+
+from django.apps import apps as global_apps
+from django.db import connections, transaction
+from django.db.models import Q
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+BATCH_SIZE = 2000
+
+_pending = threading.local()
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def rate_game(ratings, results):
+    """Return {player_id: new rating} for one game.
+
+    ``results`` holds (player_id, finish) pairs where a lower finish is better and equal
+    finishes are draws. Players missing from ``ratings`` start at INITIAL_RATING.
+    """
+    if len(results) < 2:
+        return {}
+    new_ratings = {}
+    for player_id, finish in results:
+        rating = ratings.get(player_id, INITIAL_RATING)
+        surprise = 0.0
+        for opponent_id, opponent_finish in results:
+            if opponent_id == player_id:
+                continue
+            actual = 1.0 if finish < opponent_finish else 0.5 if finish == opponent_finish else 0.0
+            surprise += actual - expected_score(rating, ratings.get(opponent_id, INITIAL_RATING))
+        new_ratings[player_id] = rating + K_FACTOR * surprise / (len(results) - 1)
+    return new_ratings
+
+
+def from_position(position, prefix=''):
+    """Rows at or after ``position``, a (date_start, number) pair."""
+    date_start, number = position
+    return Q(**{prefix + 'date_start__gt': date_start}) | \
+        Q(**{prefix + 'date_start': date_start, prefix + 'number__gte': number})
+
+
+def before_position(position):
+    date_start, number = position
+    return Q(date_start__lt=date_start) | Q(date_start=date_start, number__lt=number)
+
+
+def replay(edition_id=None, since=None, apps=global_apps):
+    """Rewrite one rating stream from ``since`` (a (date_start, number) pair) onward.
+
+    ``edition_id`` None is the overall stream. Without ``since`` the stream is rebuilt from
+    the first game. ``apps`` is the model registry to use, e.g. a migration's. Returns the
+    number of history rows written.
+    """
+    Scoresheet = apps.get_model('scores', 'Scoresheet')
+    RatingHistory = apps.get_model('scores', 'RatingHistory')
+    history = RatingHistory.objects.filter(edition_id=edition_id)
+    scoresheets = Scoresheet.objects.filter(is_active=True, game__is_active=True)
+    if edition_id is not None:
+        scoresheets = scoresheets.filter(game__edition_id=edition_id)
+
+    with transaction.atomic():
+        ratings = {}
+        if since is None:
+            history.delete()
+        else:
+            history.filter(from_position(since)).delete()
+            scoresheets = scoresheets.filter(from_position(since, prefix='game__'))
+
+        def rating_before_since(player_id):
+            # Read from the rows before ``since`` rather than the stale ones: a deleted game's
+            # rows are already gone by the time its replay runs
+            if since is not None:
+                rating = history.filter(before_position(since), player_id=player_id) \
+                                .order_by('-date_start', '-number') \
+                                .values_list('rating', flat=True) \
+                                .first()
+                if rating is not None:
+                    return rating
+            return INITIAL_RATING
+
+        rows = []
+        written = 0
+        results = scoresheets.order_by('game__date_start', 'game__number', 'game_id') \
+                             .values_list('game_id', 'game__date_start', 'game__number',
+                                          'game__winning_scoresheet_id', 'pk', 'player_id', 'total_points') \
+                             .iterator(chunk_size=BATCH_SIZE)
+        for (game_id, date_start, number, winning_id), sheets in groupby(results, key=itemgetter(0, 1, 2, 3)):
+            finishes = [(player_id, (pk != winning_id, -points)) for *_, pk, player_id, points in sheets]
+            for player_id, _ in finishes:
+                if player_id not in ratings:
+                    ratings[player_id] = rating_before_since(player_id)
+
+            for player_id, rating in rate_game(ratings, finishes).items():
+                rows.append(RatingHistory(player_id=player_id, game_id=game_id, edition_id=edition_id,
+                                          date_start=date_start, number=number,
+                                          rating_before=ratings[player_id], rating=rating))
+                ratings[player_id] = rating
+            if len(rows) >= BATCH_SIZE:
+                RatingHistory.objects.bulk_create(rows)
+                written += len(rows)
+                rows = []
+        RatingHistory.objects.bulk_create(rows)
+    return written + len(rows)
+
+
+def replay_game(position, edition_ids):
+    """Replay the overall stream and the given editions' streams from ``position`` onward."""
+    replay(None, position)
+    for edition_id in {pk for pk in edition_ids if pk is not None}:
+        replay(edition_id, position)
+
+
+def replay_after_commit(position, edition_ids):
+    """Replay from ``position`` once the current transaction commits (straight away outside one).
+
+    The writes of one transaction share a single pending replay from the earliest position any
+    of them touched, so a game saved with its scoresheets is replayed once rather than once per
+    row. Writes that are rolled back can leave their position behind; the next replay then
+    starts earlier than it needs to, which is still correct.
+    """
+    pending = getattr(_pending, 'replay', None)
+    if pending is None:
+        pending = _pending.replay = {'position': position, 'edition_ids': set()}
+    pending['position'] = min(pending['position'], position)
+    pending['edition_ids'].update(edition_ids)
+    transaction.on_commit(run_pending_replay)
+
+
+def run_pending_replay():
+    pending = getattr(_pending, 'replay', None)
+    if pending is not None:
+        _pending.replay = None
+        replay_game(pending['position'], pending['edition_ids'])
+
+
+def rating_streams(apps=global_apps):
+    Game = apps.get_model('scores', 'Game')
+    return [None] + list(Game.objects.filter(is_active=True).order_by()
+                                     .values_list('edition_id', flat=True).distinct())
+
+
+def rebuild_stream(edition_id):
+    """Pool worker: rebuild one stream on the worker's own connection."""
+    try:
+        return replay(edition_id)
+    finally:
+        connections.close_all()
+
+
+def rebuild_ratings(processes=1, apps=global_apps):
+    """Rebuild every rating stream from scratch and return the number of rows written.
+
+    Streams share no state, so with ``processes`` > 1 they are rebuilt in a process pool
+    (on SQLite they are always rebuilt in this process). Each worker opens its own database
+    connection; call this outside any transaction. Migrations pass their ``apps`` and are
+    always rebuilt in this process.
+    """
+    RatingHistory = apps.get_model('scores', 'RatingHistory')
+    streams = rating_streams(apps)
+    # Editions without active games left have no stream to rebuild, so drop their history here
+    RatingHistory.objects.filter(edition__isnull=False).exclude(edition_id__in=streams[1:]).delete()
+    # SQLite allows one writer at a time, and forked workers cannot see an in-memory database
+    if (processes <= 1 or len(streams) <= 1 or apps is not global_apps or
+            connections[RatingHistory.objects.db].vendor == 'sqlite'):
+        return sum(replay(edition_id, apps=apps) for edition_id in streams)
+
+    # Forked workers must not share the parent's open connections
+    connections.close_all()
+    with multiprocessing.get_context('fork').Pool(min(processes, len(streams))) as pool:
+        return sum(pool.map(rebuild_stream, streams))
@@ -0,0 +1,70 @@
+"""Recording a finished game, its scoresheets and its winner in one go.
+
+The game and its scoresheets are inserted with ``bulk_create`` inside a single transaction,
+so a recorded game costs the same number of writes whether two or six people played. Bulk
+inserts skip the signal receivers, so the derived tables are refreshed once afterwards for
+the players, day and rating streams the game touches.
+"""
+import uuid
+
+from django.db import transaction
+
+from .models import Game, Scoresheet
+from .signals import refresh_inserted_game
+
+
+class RecordingError(ValueError):
+    pass
+
+
+def pick_winner(scoresheets):
+    """The winning scoresheet: the one marked ``is_winner``, else the unique top score."""
+    marked = [s for s in scoresheets if getattr(s, 'is_winner', False)]
+    if len(marked) > 1:
+        raise RecordingError('Only one scoresheet can be marked as the winner.')
+    if marked:
+        return marked[0]
+    top = max(s.total_points for s in scoresheets)
+    leaders = [s for s in scoresheets if s.total_points == top]
+    if len(leaders) > 1:
+        raise RecordingError('{} scoresheets share the top score of {}; mark the winner.'.format(len(leaders), top))
+    return leaders[0]
+
+
+def validate_game(game, scoresheets):
+    """Check an unsaved ``game`` and its ``scoresheets`` and return the winning scoresheet.
+
+    RecordingError is raised for fewer than two or more than six scoresheets, a repeated
+    player or color, a game that finishes before it starts, or an ambiguous winner.
+    """
+    if not 2 <= len(scoresheets) <= 6:
+        raise RecordingError('A game needs 2 to 6 scoresheets, got {}.'.format(len(scoresheets)))
+    if len({s.player_id for s in scoresheets}) != len(scoresheets):
+        raise RecordingError('A player appears on more than one scoresheet.')
+    if len({s.color for s in scoresheets}) != len(scoresheets):
+        raise RecordingError('Two players cannot share a color.')
+    if game.date_finish < game.date_start:
+        raise RecordingError('The game cannot finish before it starts.')
+    return pick_winner(scoresheets)
+
+
+def record_game(game, scoresheets):
+    """Insert an unsaved ``game`` and its unsaved ``scoresheets`` and return the game.
+
+    Both are checked with validate_game first, which raises RecordingError.
+    """
+    winner = validate_game(game, scoresheets)
+
+    game.id = game.id or uuid.uuid4()
+    for scoresheet in scoresheets:
+        scoresheet.id = scoresheet.id or uuid.uuid4()
+        scoresheet.game_id = game.id
+    game.winning_scoresheet_id = winner.id
+    game.duration = game.date_finish - game.date_start
+
+    with transaction.atomic():
+        game.number = Game.allocate_numbers()
+        Game.objects.bulk_create([game])
+        Scoresheet.objects.bulk_create(scoresheets)
+        refresh_inserted_game(game, scoresheets)
+    return game
@@ -0,0 +1,91 @@
+"""Head-to-head records for every pair of players.
+
+All pairs come from one query that joins each active scoresheet to the other scoresheets of
+the same game and groups by player pair; only the player names are fetched separately.
+"""
+from dataclasses import dataclass
+from typing import List
+
+from django.db.models import Avg, Count, F, Q
+
+from .models import Player, Scoresheet
+
+
+@dataclass
+class Rivalry:
+    player_id: object
+    player: str
+    opponent_id: object
+    opponent: str
+    games: int
+    wins: int
+    losses: int
+    average_differential: float
+
+    @property
+    def draws(self):
+        """Games that neither side of the pair won."""
+        return self.games - self.wins - self.losses
+
+    def reversed(self):
+        return Rivalry(player_id=self.opponent_id, player=self.opponent,
+                       opponent_id=self.player_id, opponent=self.player,
+                       games=self.games, wins=self.losses, losses=self.wins,
+                       average_differential=-self.average_differential)
+
+    def as_dict(self):
+        return {
+            'player_id': str(self.player_id),
+            'player': self.player,
+            'opponent_id': str(self.opponent_id),
+            'opponent': self.opponent,
+            'games': self.games,
+            'wins': self.wins,
+            'losses': self.losses,
+            'average_differential': round(self.average_differential, 2),
+        }
+
+
+def compute_rivalries() -> List[Rivalry]:
+    """Return one Rivalry per pair of players that have shared a game, most played first.
+
+    Each pair appears once, with ``player`` being the one with the smaller id.
+    """
+    # Both sides of the pair must come from the same join to game__scoresheet, so keep the
+    # lookups in a single filter() and let values()/annotate() reuse its alias
+    pairs = Scoresheet.objects.filter(is_active=True, game__is_active=True,
+                                      game__scoresheet__is_active=True,
+                                      player__lt=F('game__scoresheet__player')) \
+                              .values('player', 'game__scoresheet__player') \
+                              .order_by() \
+                              .annotate(games=Count('pk'),
+                                        wins=Count('pk', filter=Q(game__winning_scoresheet=F('pk'))),
+                                        losses=Count('pk', filter=Q(game__winning_scoresheet=F('game__scoresheet'))),
+                                        average_differential=Avg(F('total_points') -
+                                                                 F('game__scoresheet__total_points')))
+    pairs = list(pairs)
+
+    player_ids = {row['player'] for row in pairs} | {row['game__scoresheet__player'] for row in pairs}
+    names = {player.pk: player.get_short_name() for player in Player.objects.filter(pk__in=player_ids)}
+
+    rivalries = [Rivalry(player_id=row['player'], player=names[row['player']],
+                         opponent_id=row['game__scoresheet__player'],
+                         opponent=names[row['game__scoresheet__player']],
+                         games=row['games'], wins=row['wins'], losses=row['losses'],
+                         average_differential=float(row['average_differential'] or 0))
+                 for row in pairs]
+    rivalries.sort(key=lambda rivalry: (-rivalry.games, rivalry.player, rivalry.opponent))
+    return rivalries
+
+
+def rivalry_matrix(rivalries):
+    """Arrange pairs as (players, rows) where each row is (player, [Rivalry or None per column])."""
+    records = {}
+    for rivalry in rivalries:
+        records[rivalry.player_id, rivalry.opponent_id] = rivalry
+        records[rivalry.opponent_id, rivalry.player_id] = rivalry.reversed()
+
+    players = sorted({(r.player, r.player_id) for r in rivalries} | {(r.opponent, r.opponent_id) for r in rivalries},
+                     key=lambda player: player[0])
+    rows = [(name, [records.get((pk, other_pk)) for _, other_pk in players]) for name, pk in players]
+    return [name for name, _ in players], rows
@@ -0,0 +1,154 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_pages
+from .models import (Player, Location, Edition, Game, Scoresheet, PlayerStats, WinStreak, EditionPlayerRollup,
+                     DailyRollup, DailyPlayerRollup)
+from .ratings import rebuild_ratings, replay_after_commit
+
+
+def rebuild_derived_tables():
+    """Recompute every derived table from scratch, e.g. after bulk writes that skip the signals."""
+    PlayerStats.objects.refresh()
+    WinStreak.objects.refresh()
+    EditionPlayerRollup.objects.refresh()
+    DailyRollup.objects.refresh()
+    DailyPlayerRollup.objects.refresh()
+    rebuild_ratings()
+    invalidate_pages()
+
+
+def refresh_inserted_game(game, scoresheets):
+    """Bring the derived tables up to date with one game inserted by ``bulk_create``."""
+    refresh_player_tables({scoresheet.player_id for scoresheet in scoresheets})
+    refresh_daily_tables(game.date_start)
+    replay_after_commit((game.date_start, game.number), {game.edition_id})
+    invalidate_pages()
+
+
+def refresh_player_tables(player_ids):
+    """Refresh the per-player derived tables for the players touched by a write."""
+    PlayerStats.objects.refresh(player_ids)
+    WinStreak.objects.refresh(player_ids)
+    EditionPlayerRollup.objects.refresh(player_ids)
+
+
+def refresh_daily_tables(*starts):
+    """Refresh the daily rollups for the local days of the given game start times."""
+    tz = timezone.get_default_timezone()
+    days = {timezone.localtime(start, tz).date() for start in starts if start is not None}
+    DailyRollup.objects.refresh(days)
+    DailyPlayerRollup.objects.refresh(days)
+
+
+def game_player_ids(game):
+    player_ids = set(Scoresheet.objects.filter(game_id=game.pk).values_list('player_id', flat=True))
+    if game.winning_scoresheet_id:
+        player_ids.update(Scoresheet.objects.filter(pk=game.winning_scoresheet_id)
+                                            .values_list('player_id', flat=True))
+    return player_ids
+
+
+@receiver(post_save, sender=Player)
+def create_player_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        PlayerStats.objects.get_or_create(player=instance)
+        WinStreak.objects.get_or_create(player=instance)
+
+
+@receiver(pre_save, sender=Scoresheet)
+def remember_scoresheet_player(sender, instance, raw=False, **kwargs):
+    # A scoresheet moved to another player has to refresh the previous owner too
+    instance._previous_player_id = None
+    if not raw and not instance._state.adding:
+        instance._previous_player_id = Scoresheet.objects.filter(pk=instance.pk) \
+                                                         .values_list('player_id', flat=True) \
+                                                         .first()
+
+
+@receiver(post_save, sender=Scoresheet)
+@receiver(post_delete, sender=Scoresheet)
+def refresh_scoresheet_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_player_tables({instance.player_id, getattr(instance, '_previous_player_id', None)})
+
+
+@receiver(post_save, sender=Game)
+def refresh_game_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_player_tables(game_player_ids(instance))
+
+
+@receiver(pre_save, sender=Game)
+def remember_game_position(sender, instance, raw=False, **kwargs):
+    # Moving a game in time or to another edition has to replay from its old place too
+    instance._previous_position = None
+    if not raw and not instance._state.adding:
+        instance._previous_position = Game.objects.filter(pk=instance.pk) \
+                                                  .values_list('date_start', 'number', 'edition_id') \
+                                                  .first()
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def replay_game_ratings(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    position = (instance.date_start, instance.number)
+    edition_ids = {instance.edition_id}
+    previous = getattr(instance, '_previous_position', None)
+    if previous is not None:
+        position = min(position, previous[:2])
+        edition_ids.add(previous[2])
+    replay_after_commit(position, edition_ids)
+
+
+@receiver(post_save, sender=Scoresheet)
+@receiver(post_delete, sender=Scoresheet)
+def replay_scoresheet_ratings(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # The game is already gone when its deletion cascades here; its own receiver replays
+    game = Game.objects.filter(pk=instance.game_id).values_list('date_start', 'number', 'edition_id').first()
+    if game is not None:
+        replay_after_commit(game[:2], {game[2]})
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def refresh_game_days(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_position', None)
+    refresh_daily_tables(instance.date_start, previous[0] if previous else None)
+
+
+@receiver(post_save, sender=Scoresheet)
+@receiver(post_delete, sender=Scoresheet)
+def refresh_scoresheet_day(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # As with ratings, a cascading game deletion is covered by the game's own receiver
+    start = Game.objects.filter(pk=instance.game_id).values_list('date_start', flat=True).first()
+    if start is not None:
+        refresh_daily_tables(start)
+
+
+@receiver(post_save, sender=Player)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Edition)
+@receiver(post_save, sender=Game)
+@receiver(post_save, sender=Scoresheet)
+@receiver(post_delete, sender=Player)
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Edition)
+@receiver(post_delete, sender=Game)
+@receiver(post_delete, sender=Scoresheet)
+def bump_ledger(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which no page displays
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate_pages()
@@ -0,0 +1,342 @@
+"""Statistics engine for the statistics and player profile pages.
+
+Every counter is computed with one grouped, conditionally aggregated query per table
+instead of one query per counter, and returned as plain dataclasses for the view. Calendar
+counters (games and wins this month, this year, last year) are summed from the daily rollups.
+"""
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import List, Optional
+
+from django.db.models import Q, Count, Min, Max, Sum, Case, When, Value, IntegerField
+from django.utils import timezone
+
+from .models import Game, Scoresheet, WinStreak, EditionPlayerRollup, DailyRollup, DailyPlayerRollup
+
+
+@dataclass
+class Leader:
+    name: str
+    value: int
+
+
+@dataclass
+class PlayerCounters:
+    player_id: object
+    first_name: str
+    scoresheets: int = 0
+    points: int = 0
+    highest_score: Optional[int] = None
+    lowest_score: Optional[int] = None
+    wins_year: int = 0
+    wins_last_year: int = 0
+    settlements_year: int = 0
+    cities_year: int = 0
+    metropolises_year: int = 0
+    longest_road: int = 0
+    largest_army: int = 0
+    merchant: int = 0
+    harbormaster: int = 0
+    metro_science: int = 0
+    metro_politics: int = 0
+    metro_trade: int = 0
+    vpcards: int = 0
+    chits: int = 0
+    longest_streak: int = 0
+
+
+@dataclass
+class Statistics:
+    games_played_year: int = 0
+    games_played_this_month: int = 0
+    games_played_last_month: int = 0
+    shortest_game: Optional[timedelta] = None
+    longest_game: Optional[timedelta] = None
+    total_duration: Optional[timedelta] = None
+    last_winner: Optional[str] = None
+    current_win_streak: int = 0
+    most_winning_start_position: Optional[int] = None
+    favorite_week_day: Optional[int] = None
+    editions_played: int = 0
+    favorite_edition: Optional[str] = None
+    players: List[PlayerCounters] = field(default_factory=list)
+
+    def leader(self, counter):
+        """Return the player with the highest non-zero value for ``counter``, or None."""
+        ranked = [p for p in self.players if getattr(p, counter)]
+        if not ranked:
+            return None
+        best = max(ranked, key=lambda p: getattr(p, counter))
+        return Leader(best.first_name, getattr(best, counter))
+
+    @property
+    def highest_score(self):
+        scores = [p.highest_score for p in self.players if p.highest_score is not None]
+        return max(scores) if scores else None
+
+    @property
+    def lowest_score(self):
+        scores = [p.lowest_score for p in self.players if p.lowest_score is not None]
+        return min(scores) if scores else None
+
+    @property
+    def average_score(self):
+        scoresheets = sum(p.scoresheets for p in self.players)
+        return sum(p.points for p in self.players) / scoresheets if scoresheets else None
+
+    @property
+    def most_wins_year(self):
+        return self.leader('wins_year')
+
+    @property
+    def longest_win_streak(self):
+        return self.leader('longest_streak')
+
+    @property
+    def most_wins_last_year(self):
+        return self.leader('wins_last_year')
+
+    @property
+    def most_settlements(self):
+        return self.leader('settlements_year')
+
+    @property
+    def most_cities(self):
+        return self.leader('cities_year')
+
+    @property
+    def most_metropolises(self):
+        return self.leader('metropolises_year')
+
+    @property
+    def most_longest_road(self):
+        return self.leader('longest_road')
+
+    @property
+    def most_largest_army(self):
+        return self.leader('largest_army')
+
+    @property
+    def most_merchant(self):
+        return self.leader('merchant')
+
+    @property
+    def most_harbormaster(self):
+        return self.leader('harbormaster')
+
+    @property
+    def most_science(self):
+        return self.leader('metro_science')
+
+    @property
+    def most_politics(self):
+        return self.leader('metro_politics')
+
+    @property
+    def most_trade(self):
+        return self.leader('metro_trade')
+
+    @property
+    def most_vpcards(self):
+        return self.leader('vpcards')
+
+    @property
+    def most_chits(self):
+        return self.leader('chits')
+
+
+@dataclass
+class EditionAverages:
+    edition: str
+    scoresheets: int
+    average: float
+    deviation: float
+    others_average: Optional[float] = None
+    others_deviation: Optional[float] = None
+
+
+def flag_count(flag):
+    return Count('pk', filter=Q(**{flag: True}))
+
+
+def one_if(flag):
+    return Case(When(**{flag: True}, then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def known(pick, *values):
+    values = [value for value in values if value is not None]
+    return pick(values) if values else None
+
+
+def most_common(counter):
+    return counter.most_common(1)[0][0] if counter else None
+
+
+def statistics_queries(today=None):
+    """The statistics page's queries as independent callables, keyed by name.
+
+    Each callable runs one query and returns its rows, so the queries can run one after
+    another (compute_statistics) or concurrently (scores.concurrency); build_statistics
+    folds the results together.
+    """
+    today = timezone.localdate(today)
+    month_start = today.replace(day=1)
+    last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+    year_start = today.replace(month=1, day=1)
+    last_year_start = year_start.replace(year=today.year - 1)
+
+    games = Game.objects.filter(is_active=True).order_by()
+    scoresheets = Scoresheet.objects.filter(is_active=True).order_by()
+
+    # Scoresheet table: one row per player with every counter as a conditional aggregate
+    scoresheet_year = Q(game__date_start__year=today.year)
+    player_counters = scoresheets.values('player', 'player__first_name').annotate(
+        scoresheets=Count('pk'),
+        points=Sum('total_points'),
+        highest_score=Max('total_points'),
+        lowest_score=Min('total_points'),
+        settlements_year=Sum('num_settlements', filter=scoresheet_year),
+        cities_year=Sum('num_cities', filter=scoresheet_year),
+        metropolises_year=Sum(one_if('metro_science') + one_if('metro_politics') + one_if('metro_trade'),
+                              filter=scoresheet_year),
+        longest_road=flag_count('longest_road'),
+        largest_army=flag_count('largest_army'),
+        merchant=flag_count('merchant'),
+        harbormaster=flag_count('harbormaster'),
+        metro_science=flag_count('metro_science'),
+        metro_politics=flag_count('metro_politics'),
+        metro_trade=flag_count('metro_trade'),
+        vpcards=Sum('num_vpcards'),
+        chits=Sum('num_chits'))
+
+    # Calendar counters are range sums over the daily rollups
+    def calendar():
+        return DailyRollup.objects.filter(day__gte=min(year_start, last_month_start)).aggregate(
+            games_year=Sum('games', filter=Q(day__gte=year_start)),
+            games_this_month=Sum('games', filter=Q(day__gte=month_start)),
+            games_last_month=Sum('games', filter=Q(day__gte=last_month_start, day__lt=month_start)))
+
+    wins = DailyPlayerRollup.objects.filter(day__gte=last_year_start, wins__gt=0) \
+                                    .values('player', 'player__first_name') \
+                                    .order_by() \
+                                    .annotate(wins_year=Sum('wins', filter=Q(day__gte=year_start)),
+                                              wins_last_year=Sum('wins', filter=Q(day__lt=year_start)))
+
+    # Game table: one row per (winner start position, week day, edition) group
+    game_groups = games.values('winning_scoresheet__start_position', 'date_start__week_day', 'edition__name') \
+                       .annotate(num_games=Count('pk'),
+                                 shortest=Min('duration'),
+                                 longest=Max('duration'),
+                                 duration=Sum('duration'))
+
+    # Streaks are maintained in the WinStreak table, so only the latest winner is looked up here
+    def last_winner():
+        return games.exclude(winning_scoresheet__isnull=True) \
+                    .order_by('-date_start', '-number') \
+                    .values_list('winning_scoresheet__player__first_name',
+                                 'winning_scoresheet__player__streak__current_streak') \
+                    .first()
+
+    streaks = WinStreak.objects.filter(longest_streak__gt=0) \
+                               .values_list('player', 'player__first_name', 'longest_streak')
+
+    return {
+        'player_counters': lambda: list(player_counters),
+        'calendar': calendar,
+        'wins': lambda: list(wins),
+        'game_groups': lambda: list(game_groups),
+        'last_winner': last_winner,
+        'streaks': lambda: list(streaks),
+    }
+
+
+def build_statistics(results):
+    """Fold the rows returned by the statistics_queries callables into Statistics."""
+    stats = Statistics()
+    players = {}
+
+    for row in results['player_counters']:
+        counters = PlayerCounters(row.pop('player'), row.pop('player__first_name'))
+        for name, value in row.items():
+            if value is not None:
+                setattr(counters, name, value)
+        players[counters.player_id] = counters
+
+    calendar = results['calendar']
+    stats.games_played_year = calendar['games_year'] or 0
+    stats.games_played_this_month = calendar['games_this_month'] or 0
+    stats.games_played_last_month = calendar['games_last_month'] or 0
+    for row in results['wins']:
+        counters = players.setdefault(row['player'], PlayerCounters(row['player'], row['player__first_name']))
+        counters.wins_year = row['wins_year'] or 0
+        counters.wins_last_year = row['wins_last_year'] or 0
+
+    # The page totals are folded together from the game groups
+    start_positions = Counter()
+    week_days = Counter()
+    editions = Counter()
+    for row in results['game_groups']:
+        stats.shortest_game = known(min, stats.shortest_game, row['shortest'])
+        stats.longest_game = known(max, stats.longest_game, row['longest'])
+        stats.total_duration = (stats.total_duration or timedelta()) + (row['duration'] or timedelta())
+        week_days[row['date_start__week_day']] += row['num_games']
+        editions[row['edition__name']] += row['num_games']
+        if row['winning_scoresheet__start_position'] is not None:
+            start_positions[row['winning_scoresheet__start_position']] += row['num_games']
+
+    if results['last_winner'] is not None:
+        stats.last_winner, current_streak = results['last_winner']
+        stats.current_win_streak = current_streak or 0
+    for player_id, first_name, longest in results['streaks']:
+        players.setdefault(player_id, PlayerCounters(player_id, first_name)).longest_streak = longest
+
+    stats.players = sorted(players.values(), key=lambda p: p.first_name)
+    stats.most_winning_start_position = most_common(start_positions)
+    stats.favorite_week_day = most_common(week_days)
+    stats.editions_played = len(editions)
+    stats.favorite_edition = most_common(editions)
+
+    return stats
+
+
+def compute_statistics(today=None):
+    return build_statistics({name: query() for name, query in statistics_queries(today).items()})
+
+
+def mean_and_deviation(count, total, total_squared):
+    """Mean and population standard deviation from a count, sum and sum of squares."""
+    if not count:
+        return None, None
+    mean = total / count
+    return mean, math.sqrt(max(total_squared / count - mean * mean, 0))
+
+
+def compute_edition_averages(player_id):
+    """Average points by edition for one player and for everyone else, with standard deviations.
+
+    Both sides come from EditionPlayerRollup: the player's own rows, then the other players'
+    rows summed by edition, so the cost does not grow with the number of scoresheets.
+    """
+    rollups = EditionPlayerRollup.objects.filter(scoresheets__gt=0)
+    editions = []
+    for edition_id, name, count, total, total_squared in rollups.filter(player=player_id) \
+            .order_by('edition__game_type', 'edition__name') \
+            .values_list('edition', 'edition__name', 'scoresheets', 'total_points', 'total_points_squared'):
+        average, deviation = mean_and_deviation(count, total, total_squared)
+        editions.append((edition_id, EditionAverages(name, count, average, deviation)))
+
+    others = rollups.exclude(player=player_id) \
+                    .filter(edition__in=[edition_id for edition_id, _ in editions]) \
+                    .values('edition') \
+                    .order_by() \
+                    .annotate(count=Sum('scoresheets'), total=Sum('total_points'),
+                              total_squared=Sum('total_points_squared'))
+    others = {row['edition']: row for row in others}
+    for edition_id, averages in editions:
+        row = others.get(edition_id)
+        if row is not None:
+            averages.others_average, averages.others_deviation = \
+                mean_and_deviation(row['count'], row['total'], row['total_squared'])
+    return [averages for _, averages in editions]
@@ -0,0 +1,24 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from scores.assets import ASSETS, is_vendored
+
+register = template.Library()
+
+# return a <script> or stylesheet <link> for a pinned front-end library, served locally
+# once it is vendored and from its CDN with the pinned integrity hash until then
+# TEMPLATE USE:  {% vendored 'jquery' %}
+@register.simple_tag
+def vendored(name):
+    asset = ASSETS[name]
+    if is_vendored(name):
+        url, attributes = static(asset.static_path), ''
+    elif asset.integrity:
+        url, attributes = asset.url, format_html(' integrity="{}" crossorigin="anonymous"', asset.integrity)
+    else:
+        url, attributes = asset.url, ''
+
+    if asset.path.endswith('.css'):
+        return format_html('<link rel="stylesheet" href="{}"{}>', url, attributes)
+    return format_html('<script src="{}"{}></script>', url, attributes)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.landing_page, name='home'),
@@ -9,6 +9,9 @@ urlpatterns = [
     
     path('comparisons/', views.comparisons_page, name='comparisons'),
 
+    path('rivalries/', views.rivalries_page, name='rivalries'),
+    path('rivalries/json', views.rivalries_json, name='rivalries-json'),
+
     path('locations/', views.location_page, name='locations'),
 
     path('editions/', views.edition_list, name='editions'),
@@ -20,4 +23,13 @@ urlpatterns = [
 
     path('scoresheets/', views.scoresheet_list, name='scoresheets'),
     path('scoresheets/game/<game>', views.scoresheet_list, name='game-scoresheets'),
+
+    path('export/scoresheets.csv', views.export_scoresheets_csv, name='export-scoresheets'),
+    path('export/games.ndjson', views.export_games_ndjson, name='export-games'),
+
+    path('api/v1/stats/year-points/', api.year_points, name='api-year-points'),
+    path('api/v1/stats/year-wins/', api.year_wins, name='api-year-wins'),
+    path('api/v1/players/<uuid:player>/last-games/', api.player_recent_games, name='api-player-last-games'),
+    path('api/v1/players/<uuid:player>/edition-averages/', api.player_edition_averages,
+         name='api-player-edition-averages'),
 ]